@@ -1,12 +1,17 @@
+import functools
 import os
+import time
 import gradio as gr
+import uvicorn
 from dotenv import load_dotenv
-from manual_vertical_service import (
-    generate_caption_ideas,
-    generate_content_ideas,
-    generate_caption_ideas_claude,
-    generate_content_ideas_claude,
-)
+from typing import Optional
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from costs import ledger
+from deadline import Deadline
+from manual_vertical_service import generate_both, generate_ideas, generate_ideas_stream
+from metrics import CONTENT_TYPE, histogram, render_metrics
+from results_store import get_results_store
 
 # Load environment variables
 load_dotenv()
@@ -35,37 +40,95 @@ industries = [
     'Comedy'
 ]
 
-def generate_captions(text_brief: str, industry: str, model_choice: str) -> tuple[str, str, str]:
+HANDLER_SECONDS = histogram("handler_seconds", "End-to-end latency of a Generate click", ["handler", "model", "stream", "outcome"])
+
+def _as_outputs(items: list) -> tuple[str, str, str]:
+    """Pad a partial list of items to the three output textboxes."""
+    padded = list(items) + [""] * 3
+    return padded[0], padded[1], padded[2]
+
+def _timed(streams: bool = True):
+    """Record a handler's end-to-end latency, from the click to its last output.
+
+    Handlers that stream take the "Stream results" checkbox as their last input;
+    the others are labelled stream="false".
+    """
+    def decorate(handler):
+        @functools.wraps(handler)
+        def timed(text_brief: str, industry: str, model_choice: str, stream_output: bool = streams):
+            started = time.perf_counter()
+            # Clicks abandoned mid-stream keep this outcome
+            outcome = "cancelled"
+            outputs = ()
+            args = (text_brief, industry, model_choice, stream_output) if streams else (text_brief, industry, model_choice)
+            try:
+                for outputs in handler(*args):
+                    yield outputs
+                outcome = "error" if outputs and str(outputs[0]).startswith("Error:") else "ok"
+            finally:
+                HANDLER_SECONDS.observe(time.perf_counter() - started, handler=handler.__name__,
+                                        model=model_choice, stream=str(streams and bool(stream_output)).lower(), outcome=outcome)
+        return timed
+    return decorate
+
+@_timed()
+def generate_captions(text_brief: str, industry: str, model_choice: str, stream_output: bool = True):
+    try:
+        if not text_brief or not text_brief.strip():
+            yield "Please enter a campaign brief", "Please enter a campaign brief", "Please enter a campaign brief"
+            return
+        if not industry:
+            yield "Please select an industry", "Please select an industry", "Please select an industry"
+            return
+        deadline = Deadline.from_env()
+        if stream_output:
+            for captions in generate_ideas_stream("captions", text_brief, industry, model_choice, deadline):
+                yield _as_outputs(captions)
+            return
+        captions = generate_ideas("captions", text_brief, industry, model_choice, deadline)
+        yield captions[0], captions[1], captions[2]
+    except Exception as e:
+        import traceback
+        error_msg = f"Error: {str(e)}\n{traceback.format_exc()}"
+        yield error_msg, error_msg, error_msg
+
+@_timed()
+def generate_content(text_brief: str, industry: str, model_choice: str, stream_output: bool = True):
     try:
         if not text_brief or not text_brief.strip():
-            return "Please enter a campaign brief", "Please enter a campaign brief", "Please enter a campaign brief"
+            yield "Please enter a campaign brief", "Please enter a campaign brief", "Please enter a campaign brief"
+            return
         if not industry:
-            return "Please select an industry", "Please select an industry", "Please select an industry"
-        if model_choice == "gpt-4":
-            captions = generate_caption_ideas(text_brief, industry)
-        else:
-            captions = generate_caption_ideas_claude(text_brief, industry)
-        return captions[0], captions[1], captions[2]
+            yield "Please select an industry", "Please select an industry", "Please select an industry"
+            return
+        deadline = Deadline.from_env()
+        if stream_output:
+            for contents in generate_ideas_stream("content_ideas", text_brief, industry, model_choice, deadline):
+                yield _as_outputs(contents)
+            return
+        contents = generate_ideas("content_ideas", text_brief, industry, model_choice, deadline)
+        yield contents[0], contents[1], contents[2]
     except Exception as e:
         import traceback
         error_msg = f"Error: {str(e)}\n{traceback.format_exc()}"
-        return error_msg, error_msg, error_msg
+        yield error_msg, error_msg, error_msg
 
-def generate_content(text_brief: str, industry: str, model_choice: str) -> tuple[str, str, str]:
+@_timed(streams=False)
+def generate_all(text_brief: str, industry: str, model_choice: str):
+    """Fill captions and content ideas from one click; they are generated together, so results arrive together and are not streamed."""
     try:
         if not text_brief or not text_brief.strip():
-            return "Please enter a campaign brief", "Please enter a campaign brief", "Please enter a campaign brief"
+            yield ("Please enter a campaign brief",) * 6
+            return
         if not industry:
-            return "Please select an industry", "Please select an industry", "Please select an industry"
-        if model_choice == "gpt-4":
-            contents = generate_content_ideas(text_brief, industry)
-        else:
-            contents = generate_content_ideas_claude(text_brief, industry)
-        return contents[0], contents[1], contents[2]
+            yield ("Please select an industry",) * 6
+            return
+        result = generate_both(text_brief, industry, model_choice, Deadline.from_env())
+        yield _as_outputs(result["captions"]) + _as_outputs(result["content_ideas"])
     except Exception as e:
         import traceback
         error_msg = f"Error: {str(e)}\n{traceback.format_exc()}"
-        return error_msg, error_msg, error_msg
+        yield (error_msg,) * 6
 
 # Create the Gradio interface
 demo = gr.Blocks()
@@ -91,10 +154,15 @@ with demo:
                 label="Select Model",
                 value="gpt-4"
             )
+            stream_output = gr.Checkbox(
+                label="Stream results as they are generated",
+                value=True
+            )
             
             with gr.Row():
                 caption_button = gr.Button("Generate Captions")
                 content_button = gr.Button("Generate Content Ideas")
+                both_button = gr.Button("Generate Both")
     
     with gr.Row():
         with gr.Column():
@@ -111,17 +179,51 @@ with demo:
     
     caption_button.click(
         fn=generate_captions,
-        inputs=[text_brief, industry, model_choice],
+        inputs=[text_brief, industry, model_choice, stream_output],
         outputs=[caption1, caption2, caption3],
         api_name="generate_captions"
     )
     
     content_button.click(
         fn=generate_content,
-        inputs=[text_brief, industry, model_choice],
+        inputs=[text_brief, industry, model_choice, stream_output],
         outputs=[content1, content2, content3],
         api_name="generate_content"
     )
 
+    both_button.click(
+        fn=generate_all,
+        inputs=[text_brief, industry, model_choice],
+        outputs=[caption1, caption2, caption3, content1, content2, content3],
+        api_name="generate_both"
+    )
+
+def create_server() -> FastAPI:
+    """Serve the Gradio UI with /metrics (Prometheus), /budget (token and cost report) and /results next to it."""
+    server = FastAPI()
+
+    @server.get("/metrics")
+    def metrics():
+        return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
+    @server.get("/budget")
+    def budget(recent: int = 50):
+        return ledger.report(recent)
+
+    @server.get("/results")
+    def results(brief_hash: Optional[str] = None, industry: Optional[str] = None, model: Optional[str] = None,
+                kind: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None, limit: int = 100):
+        store = get_results_store()
+        if store is None:
+            raise HTTPException(status_code=404, detail="Results are not stored (set RESULTS_DB)")
+        return store.query(industry=industry, model=model, kind=kind, since=since, until=until, limit=min(limit, 1000), digest=brief_hash)
+
+    return gr.mount_gradio_app(server, demo, path="/")
+
 # Launch the app
-demo.launch() 
\ No newline at end of file
+if __name__ == "__main__":
+    uvicorn.run(
+        create_server(),
+        host=os.getenv("GRADIO_SERVER_NAME", "0.0.0.0"),
+        port=int(os.getenv("GRADIO_SERVER_PORT", "7860"))
+    )
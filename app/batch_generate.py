@@ -0,0 +1,129 @@
+"""Generate captions and content ideas for many briefs from the command line.
+
+Reads briefs from a CSV or JSONL file with the columns/fields:
+    id        unique brief id (defaults to the row number)
+    brief     campaign brief text (required)
+    industry  one of the industries in app.py (required)
+    model     "gpt-4", "claude" or "mock" (default: --model)
+    kind      "captions", "content_ideas" or "both" (default: --kind); "both"
+              runs as one combined generation (see generate_both)
+
+Results are appended to a JSONL file as soon as each brief finishes, and the
+ids of successful briefs are recorded in a checkpoint file, so an interrupted run
+can be restarted with the same arguments and will only run the rest. A brief
+that came back with a provider's placeholder items (Claude returns those instead
+of raising) counts as failed.
+
+    python batch_generate.py briefs.csv results.jsonl --concurrency 8
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Set
+
+from manual_vertical_service import generate_both_async, generate_ideas_async, is_placeholder
+from prompts import CONTENT_KINDS
+from providers import provider_names
+
+def read_briefs(path: str, default_model: str, default_kind: str) -> List[Dict[str, str]]:
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    briefs = []
+    for number, row in enumerate(rows, start=1):
+        briefs.append({
+            "id": str(row.get("id") or number),
+            "brief": row.get("brief") or "",
+            "industry": row.get("industry") or "",
+            "model": row.get("model") or default_model,
+            "kind": row.get("kind") or default_kind,
+        })
+    return briefs
+
+def read_checkpoint(path: str) -> Set[str]:
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+async def process_brief(brief: Dict[str, str]) -> Dict[str, object]:
+    started = time.perf_counter()
+    result: Dict[str, object] = {"id": brief["id"], "industry": brief["industry"], "model": brief["model"]}
+    try:
+        if not brief["brief"].strip() or not brief["industry"]:
+            raise ValueError("brief and industry are required")
+        kinds = list(CONTENT_KINDS) if brief["kind"] == "both" else [brief["kind"]]
+        if brief["model"] not in provider_names() or any(kind not in CONTENT_KINDS for kind in kinds):
+            raise ValueError(f"unsupported kind/model: {brief['kind']}/{brief['model']}")
+        if brief["kind"] == "both":
+            outputs = await generate_both_async(brief["brief"], brief["industry"], brief["model"])
+            result.update((kind, outputs[kind]) for kind in kinds)
+        else:
+            result[brief["kind"]] = await generate_ideas_async(brief["kind"], brief["brief"], brief["industry"], brief["model"])
+        failed = [kind for kind in kinds if is_placeholder(brief["model"], kind, result[kind])]
+        if failed:
+            raise RuntimeError(f"generation failed, provider returned placeholders for {', '.join(failed)}")
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+async def run(briefs: List[Dict[str, str]], output_path: str, checkpoint_path: str, concurrency: int) -> None:
+    done = read_checkpoint(checkpoint_path)
+    pending = [brief for brief in briefs if brief["id"] not in done]
+    print(f"{len(briefs)} briefs, {len(briefs) - len(pending)} already done, {len(pending)} to run with concurrency {concurrency}")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+    finished = failed = 0
+
+    async def worker(brief: Dict[str, str]) -> Dict[str, object]:
+        async with semaphore:
+            return await process_brief(brief)
+
+    with open(output_path, "a", encoding="utf-8") as output, open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        for next_result in asyncio.as_completed([worker(brief) for brief in pending]):
+            result = await next_result
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            if "error" in result:
+                failed += 1
+            else:
+                # Failed briefs are not checkpointed, so a rerun retries them
+                checkpoint.write(f"{result['id']}\n")
+                checkpoint.flush()
+            finished += 1
+            elapsed = time.perf_counter() - started
+            # The rate counts successful briefs only
+            print(f"[{finished}/{len(pending)}] {result['id']} in {result['seconds']}s ({(finished - failed) / elapsed * 60:.1f} briefs/min)")
+
+    elapsed = time.perf_counter() - started
+    rate = (finished - failed) / elapsed * 60 if elapsed > 0 else 0.0
+    print(f"Finished {finished} briefs ({failed} failed) in {elapsed:.1f}s: {rate:.1f} briefs/min")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV or JSONL file of briefs")
+    parser.add_argument("output", help="JSONL file that results are appended to")
+    parser.add_argument("--checkpoint", help="file of completed brief ids (default: <output>.done)")
+    parser.add_argument("--concurrency", type=int, default=4, help="briefs processed at the same time")
+    parser.add_argument("--model", default="gpt-4", choices=provider_names(), help="model for rows without one")
+    parser.add_argument("--kind", default="both", choices=["captions", "content_ideas", "both"], help="what to generate for rows without a kind")
+    args = parser.parse_args()
+
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    briefs = read_briefs(args.input, args.model, args.kind)
+    if not briefs:
+        print("No briefs found", file=sys.stderr)
+        return
+    asyncio.run(run(briefs, args.output, args.checkpoint or f"{args.output}.done", args.concurrency))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Latency and throughput benchmark for the Gradio handlers.
+
+Drives generate_captions / generate_content from app.py at a fixed
+concurrency, the way Gradio calls them from worker threads. It reports
+p50/p95/p99 click latency, time to first item when streaming, upstream calls
+per click, throughput and how often generation answers failed to parse per
+provider, and writes the results as JSON so runs can be
+compared.
+
+By default a local mock server (mock_llm_server.py) is started and both
+providers are pointed at it, so no API credits are spent:
+
+    python benchmark.py --clicks 200 --concurrency 16 --output bench/baseline.json
+    python benchmark.py --latency lognormal:1.2:0.6 --error-429 0.05 --output bench/flaky.json
+    python benchmark.py --compare bench/baseline.json bench/flaky.json
+
+Parse failure rates before and after structured output, against a server that
+truncates 10% of unconstrained replies:
+
+    STRUCTURED_OUTPUT=0 python benchmark.py --malformed 0.1 --output bench/prompt_json.json
+    OPENAI_RESPONSE_FORMAT=json_schema python benchmark.py --malformed 0.1 --output bench/structured.json
+
+--no-mock benchmarks the real APIs instead (this costs money). Response
+caching is off unless LLM_CACHE is set, since every click is meant to reach
+the upstream; use --same-brief to measure request coalescing instead.
+"""
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from mock_llm_server import add_config_arguments, config_from_args, serve
+
+HANDLERS = {"captions": "generate_captions", "content_ideas": "generate_content"}
+# Environment variables recorded with each run
+RECORDED_ENV = [
+    "RELEVANCE_BACKEND", "LLM_CACHE", "RATE_LIMIT", "HEDGE", "OVERGENERATE_CANDIDATES",
+    "REQUEST_DEADLINE_SECONDS", "RETRY_MAX_ATTEMPTS", "LLM_HTTP2",
+    "STRUCTURED_OUTPUT", "OPENAI_RESPONSE_FORMAT", "OPENAI_MODEL", "JOINT_GENERATION",
+]
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile, or None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    def rounded(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value, 4)
+    return {
+        "p50": rounded(percentile(values, 50)),
+        "p95": rounded(percentile(values, 95)),
+        "p99": rounded(percentile(values, 99)),
+        "mean": rounded(sum(values) / len(values)) if values else None,
+        "max": rounded(max(values)) if values else None,
+    }
+
+def _mock_stats(base_url: str) -> Dict[str, int]:
+    with urllib.request.urlopen(f"{base_url}/stats") as response:
+        return json.loads(response.read())
+
+def _parse_counts() -> Dict[str, Dict[str, float]]:
+    """Generation parse outcomes recorded so far in this process, per "provider:mode"."""
+    from metrics import REGISTRY
+    metric = REGISTRY.get("generation_parse_total")
+    counts: Dict[str, Dict[str, float]] = {}
+    for (provider, mode, outcome), value in (metric.values() if metric else {}).items():
+        row = counts.setdefault(f"{provider}:{mode}", {})
+        row[outcome] = row.get(outcome, 0) + value
+    return counts
+
+def summarize_parses(before: Dict[str, Dict[str, float]], after: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, object]]:
+    summary = {}
+    for key, outcomes in after.items():
+        counts = {outcome: int(value - before.get(key, {}).get(outcome, 0)) for outcome, value in outcomes.items()}
+        total = sum(counts.values())
+        if total:
+            summary[key] = {**counts, "total": total, "failure_rate": round(counts.get("failed", 0) / total, 4)}
+    return summary
+
+def run_click(handler, brief: str, industry: str, model: str, stream: bool) -> Dict[str, object]:
+    """Run one click to completion, timing the first non-empty item and the final output."""
+    started = time.perf_counter()
+    first_item = None
+    outputs = ()
+    for outputs in handler(brief, industry, model, stream):
+        if first_item is None and any(outputs):
+            first_item = time.perf_counter() - started
+    return {
+        "seconds": time.perf_counter() - started,
+        "first_item": first_item,
+        "error": any(str(output).startswith("Error:") for output in outputs),
+    }
+
+def run(args: argparse.Namespace) -> Dict[str, object]:
+    mock_url = None
+    if not args.no_mock:
+        server = serve(config_from_args(args), port=0, background=True)
+        mock_url = f"http://127.0.0.1:{server.server_address[1]}"
+        os.environ["OPENAI_BASE_URL"] = f"{mock_url}/v1"
+        os.environ["ANTHROPIC_BASE_URL"] = mock_url
+        os.environ.setdefault("OPENAI_API_KEY", "mock-key")
+        os.environ.setdefault("ANTHROPIC_API_KEY", "mock-key")
+    os.environ.setdefault("LLM_CACHE", "0")
+
+    # Imported here so the base URLs above are in place before the clients are built
+    import app
+
+    handler = getattr(app, HANDLERS[args.kind])
+    stream = not args.no_stream
+
+    def click(number: int) -> Dict[str, object]:
+        brief = args.brief if args.same_brief else f"{args.brief} (variant {number})"
+        return run_click(handler, brief, args.industry, args.model, stream)
+
+    for number in range(args.warmup):
+        click(-1 - number)
+
+    before = _mock_stats(mock_url) if mock_url else {}
+    parses_before = _parse_counts()
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(click, range(args.clicks)))
+    elapsed = time.perf_counter() - started
+    after = _mock_stats(mock_url) if mock_url else {}
+    parses = summarize_parses(parses_before, _parse_counts())
+
+    upstream = {name: after.get(name, 0) - before.get(name, 0) for name in after}
+    upstream_calls = upstream.get("openai_requests", 0) + upstream.get("anthropic_requests", 0)
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "clicks": args.clicks,
+            "concurrency": args.concurrency,
+            "kind": args.kind,
+            "model": args.model,
+            "industry": args.industry,
+            "stream": stream,
+            "same_brief": args.same_brief,
+            "mock": None if args.no_mock else {
+                "latency": args.latency, "error_429": args.error_429, "error_5xx": args.error_5xx,
+                "malformed": args.malformed, "irrelevant_rate": args.irrelevant_rate, "seed": args.seed,
+            },
+        },
+        "env": {name: os.environ[name] for name in RECORDED_ENV if name in os.environ},
+        "seconds": round(elapsed, 3),
+        "errors": sum(1 for result in results if result["error"]),
+        "throughput_clicks_per_second": round(len(results) / elapsed, 3) if elapsed > 0 else None,
+        "latency": summarize([result["seconds"] for result in results]),
+        "first_item": summarize([result["first_item"] for result in results if result["first_item"] is not None]),
+        "upstream_calls_per_click": round(upstream_calls / len(results), 3) if mock_url and results else None,
+        "upstream": upstream,
+        "parse": parses,
+    }
+
+def _failure_rate(parses: Optional[Dict[str, Dict[str, object]]]) -> Optional[float]:
+    """Share of generation answers that fell back to default ideas, across providers."""
+    if not parses:
+        return None
+    total = sum(row["total"] for row in parses.values())
+    return round(sum(row.get("failed", 0) for row in parses.values()) / total, 4) if total else None
+
+def compare(paths: List[str]) -> None:
+    runs = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            runs.append(json.load(f))
+    rows = [
+        ("latency p50", lambda run: run["latency"]["p50"]),
+        ("latency p95", lambda run: run["latency"]["p95"]),
+        ("latency p99", lambda run: run["latency"]["p99"]),
+        ("first item p50", lambda run: run["first_item"]["p50"]),
+        ("first item p95", lambda run: run["first_item"]["p95"]),
+        ("clicks/s", lambda run: run["throughput_clicks_per_second"]),
+        ("upstream calls/click", lambda run: run["upstream_calls_per_click"]),
+        ("errors", lambda run: run["errors"]),
+        ("parse failure rate", lambda run: _failure_rate(run.get("parse"))),
+    ]
+    names = [os.path.basename(path) for path in paths]
+    print(f"{'metric':<22}" + "".join(f"{name:>22}" for name in names))
+    for label, value in rows:
+        print(f"{label:<22}" + "".join(f"{str(value(run)):>22}" for run in runs))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clicks", type=int, default=50, help="measured clicks")
+    parser.add_argument("--concurrency", type=int, default=8, help="clicks in flight at once")
+    parser.add_argument("--warmup", type=int, default=2, help="unmeasured clicks run first")
+    parser.add_argument("--kind", default="captions", choices=sorted(HANDLERS), help="which button to click")
+    parser.add_argument("--model", default="gpt-4", choices=["gpt-4", "claude", "mock"], help="model choice (mock answers in-process, without HTTP)")
+    parser.add_argument("--industry", default="Fitness")
+    parser.add_argument("--brief", default="Launch campaign for a lightweight running shoe aimed at first-time marathon runners")
+    parser.add_argument("--same-brief", action="store_true", help="send the identical brief on every click")
+    parser.add_argument("--no-stream", action="store_true", help="use the non-streaming path")
+    parser.add_argument("--no-mock", action="store_true", help="call the real APIs instead of the mock server")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", nargs="+", metavar="RESULTS", help="print earlier result files side by side and exit")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return
+    if args.clicks < 1 or args.concurrency < 1:
+        parser.error("--clicks and --concurrency must be at least 1")
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
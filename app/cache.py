@@ -0,0 +1,196 @@
+"""Content-addressed cache for upstream LLM responses and relevance verdicts.
+
+Keys are SHA-256 hashes of the provider, model, messages and sampling
+parameters, so an identical request always maps to the same entry. Each cache
+has an in-memory LRU tier with TTL and entry/byte limits, plus an optional
+SQLite tier that survives restarts. Calls made inside uncached() (regenerating
+a rejected item) want a new answer to the same request, so they neither read
+nor write the caches.
+
+Configuration (environment variables):
+    LLM_CACHE                "0" disables both caches (default "1")
+    LLM_CACHE_DB             path of the SQLite file for the on-disk tier (unset = memory only)
+    LLM_CACHE_TTL            seconds a generation response stays valid (default 3600)
+    LLM_CACHE_MAX_ENTRIES    in-memory entries per cache (default 1024)
+    LLM_CACHE_MAX_BYTES      in-memory payload bytes per cache (default 16 MB)
+    RELEVANCE_CACHE_TTL      seconds a relevance verdict stays valid (default 7 days)
+"""
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from env import env_float
+from logs import get_logger
+from metrics import counter_func, gauge_func
+
+log = get_logger("cache")
+
+_MISSING = object()
+
+def make_key(*parts: Any, **params: Any) -> str:
+    """Hash the request parts and sampling parameters into a cache key."""
+    payload = json.dumps([parts, params], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class MemoryTier:
+    """Thread-safe LRU with per-entry expiry and entry/byte limits."""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, size, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self._bytes -= size
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (time.time() + ttl, size, value)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SQLiteTier:
+    """On-disk tier stored as JSON text in a single SQLite table."""
+
+    def __init__(self, path: str, table: str):
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+            self._conn.commit()
+
+    def get(self, key: str) -> Tuple[Any, float]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return _MISSING, 0.0
+        value, expires_at = row
+        if expires_at <= time.time():
+            with self._lock:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+            return _MISSING, 0.0
+        return json.loads(value), expires_at
+
+    def set(self, key: str, encoded: str, ttl: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, encoded, time.time() + ttl),
+            )
+            self._conn.commit()
+
+class ResponseCache:
+    """Two-tier cache (memory LRU, optional SQLite) with hit/miss counters."""
+
+    def __init__(self, name: str, ttl: float, max_entries: int, max_bytes: int, db_path: Optional[str] = None):
+        self.name = name
+        self.ttl = ttl
+        self.memory = MemoryTier(max_entries, max_bytes)
+        self.disk = SQLiteTier(db_path, f"{name}_cache") if db_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.memory.get(key)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+        if self.disk is not None:
+            value, expires_at = self.disk.get(key)
+            if value is not _MISSING:
+                self.hits += 1
+                self.disk_hits += 1
+                self.memory.set(key, value, expires_at - time.time(), len(json.dumps(value)))
+                return value
+        self.misses += 1
+        return default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        encoded = json.dumps(value)
+        self.memory.set(key, value, ttl, len(encoded))
+        if self.disk is not None:
+            try:
+                self.disk.set(key, encoded, ttl)
+            except sqlite3.Error as e:
+                log.warning("cache write failed", cache=self.name, error=str(e))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.memory),
+            "evictions": self.memory.evictions,
+        }
+
+_uncached: contextvars.ContextVar[bool] = contextvars.ContextVar("uncached", default=False)
+
+@contextlib.contextmanager
+def uncached() -> Iterator[None]:
+    """Bypass the caches for the calls made inside the block."""
+    token = _uncached.set(True)
+    try:
+        yield
+    finally:
+        _uncached.reset(token)
+
+def cache_enabled() -> bool:
+    return os.getenv("LLM_CACHE", "1") != "0" and not _uncached.get()
+
+_db_path = os.getenv("LLM_CACHE_DB") or None
+_max_entries = int(env_float("LLM_CACHE_MAX_ENTRIES", 1024))
+_max_bytes = int(env_float("LLM_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+
+response_cache = ResponseCache("response", env_float("LLM_CACHE_TTL", 3600), _max_entries, _max_bytes, _db_path)
+verdict_cache = ResponseCache("verdict", env_float("RELEVANCE_CACHE_TTL", 7 * 24 * 3600), _max_entries, _max_bytes, _db_path)
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Hit/miss counters for both caches."""
+    return {"response": response_cache.stats(), "verdict": verdict_cache.stats()}
+
+_caches = (response_cache, verdict_cache)
+counter_func("llm_cache_lookups_total", "Cache lookups by outcome (disk hits count as hits)", ["cache", "result"],
+             lambda: {key: value for cache in _caches for key, value in (((cache.name, "hit"), cache.hits), ((cache.name, "miss"), cache.misses))})
+counter_func("llm_cache_disk_hits_total", "Cache hits answered by the SQLite tier", ["cache"],
+             lambda: {(cache.name,): cache.disk_hits for cache in _caches})
+counter_func("llm_cache_evictions_total", "Entries evicted from the in-memory tier", ["cache"],
+             lambda: {(cache.name,): cache.memory.evictions for cache in _caches})
+gauge_func("llm_cache_entries", "Entries in the in-memory tier", ["cache"],
+           lambda: {(cache.name,): len(cache.memory) for cache in _caches})
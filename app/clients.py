@@ -0,0 +1,195 @@
+"""Long-lived, pooled clients for the upstream LLM providers.
+
+Creating a client per request throws away the connection pool, so every call
+pays for a fresh TCP + TLS handshake. This module keeps one OpenAI client and
+one Anthropic HTTP session alive per event loop (async) or per process (sync)
+and reuses their keep-alive connections.
+
+Configuration (environment variables):
+    LLM_HTTP2                  "1" to negotiate HTTP/2 when the h2 package is installed (default "1")
+    LLM_POOL_MAX_KEEPALIVE     idle keep-alive connections kept per client (default 20)
+    LLM_POOL_KEEPALIVE_EXPIRY  seconds an idle connection is kept open (default 30)
+    OPENAI_MAX_CONNECTIONS     connection limit for api.openai.com (default 50)
+    ANTHROPIC_MAX_CONNECTIONS  connection limit for api.anthropic.com (default 50)
+
+Each provider talks to a single host through its own client, so the per-client
+connection limit is the per-host limit.
+
+Callers hold a client for the length of one request (or stream):
+
+    with async_openai_client() as client:
+        response = await client.chat.completions.create(...)
+
+When the API key changes, new requests get a new client while the old one
+drains: it is closed once the last request still using it has finished.
+"""
+import asyncio
+import contextlib
+import os
+import threading
+import weakref
+from typing import Callable, Dict, Iterator, Optional
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+from env import env_float, env_int
+from logs import get_logger
+
+log = get_logger("clients")
+
+ANTHROPIC_VERSION = "2023-06-01"
+
+class _Pooled:
+    """A shared client, the key it was built with and the requests using it."""
+    __slots__ = ("client", "api_key", "loop", "in_flight", "retired")
+
+    def __init__(self, client, api_key: Optional[str], loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.client = client
+        self.api_key = api_key
+        # The loop an async client's connections belong to; None for sync clients
+        self.loop = loop
+        self.in_flight = 0
+        # Replaced (key rotation, reset_clients); closed once in_flight drops to 0
+        self.retired = False
+
+_lock = threading.Lock()
+_sync_clients: Dict[str, _Pooled] = {}
+# Async clients are bound to the loop that created their connections, so they
+# are kept per loop and dropped automatically when the loop goes away.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, _Pooled]]" = weakref.WeakKeyDictionary()
+
+def _http2_enabled() -> bool:
+    if os.getenv("LLM_HTTP2", "1") != "1":
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def _limits(provider: str) -> httpx.Limits:
+    max_connections = env_int(f"{provider.upper()}_MAX_CONNECTIONS", 50)
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=min(max_connections, env_int("LLM_POOL_MAX_KEEPALIVE", 20)),
+        keepalive_expiry=env_float("LLM_POOL_KEEPALIVE_EXPIRY", 30.0),
+    )
+
+def _anthropic_headers(api_key: Optional[str]) -> Dict[str, str]:
+    return {
+        "x-api-key": api_key or "",
+        "anthropic-version": ANTHROPIC_VERSION,
+        "content-type": "application/json",
+    }
+
+def _close_async_client(loop: asyncio.AbstractEventLoop, client) -> None:
+    # A loop that is no longer running cannot close its connections; they are
+    # released when the client is garbage collected.
+    if loop.is_closed() or not loop.is_running():
+        return
+    close = getattr(client, "aclose", None) or getattr(client, "close")
+    try:
+        asyncio.run_coroutine_threadsafe(close(), loop)
+    except Exception as e:
+        log.warning("error closing client", error=str(e))
+
+def _close(pooled: _Pooled) -> None:
+    if pooled.loop is not None:
+        _close_async_client(pooled.loop, pooled.client)
+        return
+    try:
+        pooled.client.close()
+    except Exception as e:
+        log.warning("error closing client", error=str(e))
+
+def _retire(pooled: _Pooled) -> bool:
+    """Stop handing the client out; returns whether it can be closed now. Call with _lock held."""
+    pooled.retired = True
+    return pooled.in_flight == 0
+
+@contextlib.contextmanager
+def _lease(clients: Dict[str, _Pooled], name: str, api_key: Optional[str], factory: Callable,
+           loop: Optional[asyncio.AbstractEventLoop] = None) -> Iterator:
+    """Hand out the pooled client for one request, replacing it if the key changed."""
+    idle = None
+    with _lock:
+        pooled = clients.get(name)
+        if pooled is None or pooled.api_key != api_key:
+            if pooled is not None and _retire(pooled):
+                idle = pooled
+            pooled = _Pooled(factory(api_key), api_key, loop)
+            clients[name] = pooled
+        pooled.in_flight += 1
+    if idle is not None:
+        _close(idle)
+    try:
+        yield pooled.client
+    finally:
+        with _lock:
+            pooled.in_flight -= 1
+            drained = pooled.retired and pooled.in_flight == 0
+        if drained:
+            _close(pooled)
+
+def openai_client() -> "contextlib.AbstractContextManager[OpenAI]":
+    """Hold the shared synchronous OpenAI client for one request."""
+    return _lease(
+        _sync_clients,
+        "openai",
+        os.getenv("OPENAI_API_KEY"),
+        lambda api_key: OpenAI(
+            api_key=api_key,
+            max_retries=0,  # retries are handled by retry.py
+            http_client=DefaultHttpxClient(limits=_limits("openai"), http2=_http2_enabled()),
+        ),
+    )
+
+def _async_lease(name: str, api_key: Optional[str], factory: Callable):
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+    return _lease(clients, name, api_key, factory, loop)
+
+def async_openai_client() -> "contextlib.AbstractContextManager[AsyncOpenAI]":
+    """Hold the AsyncOpenAI client of the running event loop for one request."""
+    return _async_lease(
+        "openai",
+        os.getenv("OPENAI_API_KEY"),
+        lambda api_key: AsyncOpenAI(
+            api_key=api_key,
+            max_retries=0,  # retries are handled by retry.py
+            http_client=DefaultAsyncHttpxClient(limits=_limits("openai"), http2=_http2_enabled()),
+        ),
+    )
+
+def async_anthropic_session() -> "contextlib.AbstractContextManager[httpx.AsyncClient]":
+    """Hold the keep-alive HTTP session for the Anthropic API on the running event loop for one request."""
+    return _async_lease(
+        "anthropic",
+        os.getenv("ANTHROPIC_API_KEY"),
+        lambda api_key: httpx.AsyncClient(
+            headers=_anthropic_headers(api_key),
+            # httpx's default 5s read timeout is shorter than a completion; each
+            # request passes call_timeout() instead (see providers.py)
+            timeout=httpx.Timeout(None),
+            limits=_limits("anthropic"),
+            http2=_http2_enabled(),
+        ),
+    )
+
+def reset_clients() -> None:
+    """Retire every pooled client so the next call rebuilds it.
+
+    Clients are also rebuilt automatically when the API key in the environment
+    changes; call this after rotating keys through other means or after
+    changing the pool settings. Clients with requests in flight are closed when
+    those finish.
+    """
+    with _lock:
+        pooled = list(_sync_clients.values()) + [p for clients in _async_clients.values() for p in clients.values()]
+        idle = [p for p in pooled if _retire(p)]
+        _sync_clients.clear()
+        _async_clients.clear()
+    for p in idle:
+        _close(p)
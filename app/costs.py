@@ -0,0 +1,247 @@
+"""Token and cost accounting with per-brief budgets.
+
+Every upstream response's usage (OpenAI `usage`, Anthropic `usage` blocks) is
+priced and recorded in a ledger, aggregated per request, per industry, per
+day, per stage (generate / validate / regenerate) and per model. Cached
+responses cost nothing and are not recorded.
+
+Each click runs inside brief_budget(), which tracks what that brief has spent
+so far. Once a brief's token or cost budget is exhausted, within_budget()
+turns false and the service stops validating and regenerating, returning the
+items it already has (as it does when the deadline is near):
+
+    with brief_budget(industry):
+        ...
+        if within_budget():
+            regenerate()
+
+A click can run several generations (captions and content ideas); what each
+one spent is tallied by usage_scope(), which nests inside the brief's budget.
+
+Configuration (environment variables):
+    BRIEF_TOKEN_BUDGET     tokens one brief may spend (default 0, unlimited)
+    BRIEF_COST_BUDGET      US dollars one brief may spend (default 0, unlimited)
+    MODEL_PRICES           JSON overrides of USD per 1K tokens, keyed by model, e.g.
+                           {"gpt-4": {"prompt": 0.03, "completion": 0.06}}
+    LEDGER_MAX_REQUESTS    requests kept in the per-request ledger (default 500)
+"""
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from env import env_float
+from logs import get_logger
+from metrics import counter
+
+log = get_logger("costs")
+
+# USD per 1K tokens
+DEFAULT_PRICES = {
+    "gpt-4": {"prompt": 0.03, "completion": 0.06},
+    "gpt-4o": {"prompt": 0.0025, "completion": 0.01},
+    "gpt-4o-mini": {"prompt": 0.00015, "completion": 0.0006},
+    "claude-3-5-sonnet-20241022": {"prompt": 0.003, "completion": 0.015},
+    "mock": {"prompt": 0.0, "completion": 0.0},
+}
+
+COST = counter("llm_cost_usd_total", "Estimated upstream spend in US dollars", ["provider", "model", "stage"])
+
+def model_prices(model: str) -> Dict[str, float]:
+    prices = dict(DEFAULT_PRICES.get(model, {"prompt": 0.0, "completion": 0.0}))
+    try:
+        overrides = json.loads(os.getenv("MODEL_PRICES", "{}"))
+    except ValueError:
+        log.warning("ignoring invalid MODEL_PRICES JSON")
+        overrides = {}
+    prices.update(overrides.get(model, {}))
+    return prices
+
+def cost_of(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    prices = model_prices(model)
+    return (prompt_tokens * prices["prompt"] + completion_tokens * prices["completion"]) / 1000
+
+def _totals() -> Dict[str, Any]:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+
+def _add(totals: Dict[str, Any], prompt_tokens: int, completion_tokens: int, cost: float) -> None:
+    totals["calls"] += 1
+    totals["prompt_tokens"] += prompt_tokens
+    totals["completion_tokens"] += completion_tokens
+    totals["cost"] += cost
+
+class BriefBudget:
+    """What one brief (click) has spent, against its token and cost limits."""
+
+    def __init__(self, industry: str = "", max_tokens: Optional[int] = None, max_cost: Optional[float] = None):
+        self.request_id = uuid.uuid4().hex[:12]
+        self.industry = industry
+        self.max_tokens = int(env_float("BRIEF_TOKEN_BUDGET", 0)) if max_tokens is None else max_tokens
+        self.max_cost = env_float("BRIEF_COST_BUDGET", 0) if max_cost is None else max_cost
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.skipped: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def spend(self, prompt_tokens: int, completion_tokens: int, cost: float) -> None:
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cost += cost
+
+    def exhausted(self) -> bool:
+        return (self.max_tokens > 0 and self.tokens >= self.max_tokens) or (self.max_cost > 0 and self.cost >= self.max_cost)
+
+    def skip(self, stage: str) -> None:
+        """Count a stage that was skipped because the budget ran out."""
+        with self._lock:
+            self.skipped[stage] = self.skipped.get(stage, 0) + 1
+
+class Usage:
+    """Tokens and cost spent by the upstream calls inside one usage_scope()."""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self._lock = threading.Lock()
+
+    def spend(self, prompt_tokens: int, completion_tokens: int, cost: float) -> None:
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cost += cost
+
+class Ledger:
+    """Usage and cost per request, industry, day, stage and model."""
+
+    def __init__(self, max_requests: Optional[int] = None):
+        self.max_requests = int(env_float("LEDGER_MAX_REQUESTS", 500)) if max_requests is None else max_requests
+        self.requests: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.by_industry: Dict[str, Dict[str, Any]] = {}
+        self.by_day: Dict[str, Dict[str, Any]] = {}
+        self.by_stage: Dict[str, Dict[str, Any]] = {}
+        self.by_model: Dict[str, Dict[str, Any]] = {}
+        self.total = _totals()
+        self._lock = threading.Lock()
+
+    def record(self, budget: Optional[BriefBudget], provider: str, model: str, stage: str, prompt_tokens: int, completion_tokens: int) -> float:
+        cost = cost_of(model, prompt_tokens, completion_tokens)
+        industry = budget.industry if budget is not None and budget.industry else "unknown"
+        day = datetime.now(timezone.utc).date().isoformat()
+        with self._lock:
+            for table, key in ((self.by_industry, industry), (self.by_day, day), (self.by_stage, stage), (self.by_model, model)):
+                _add(table.setdefault(key, _totals()), prompt_tokens, completion_tokens, cost)
+            _add(self.total, prompt_tokens, completion_tokens, cost)
+            if budget is not None:
+                entry = self.requests.get(budget.request_id)
+                if entry is None:
+                    entry = {"request_id": budget.request_id, "industry": industry, "started": time.time(), "stages": {}, **_totals()}
+                    self.requests[budget.request_id] = entry
+                    while len(self.requests) > self.max_requests:
+                        self.requests.popitem(last=False)
+                _add(entry, prompt_tokens, completion_tokens, cost)
+                _add(entry["stages"].setdefault(stage, _totals()), prompt_tokens, completion_tokens, cost)
+        if budget is not None:
+            budget.spend(prompt_tokens, completion_tokens, cost)
+        for usage in _usage.get():
+            usage.spend(prompt_tokens, completion_tokens, cost)
+        COST.inc(cost, provider=provider, model=model, stage=stage)
+        return cost
+
+    def finish(self, budget: BriefBudget) -> None:
+        """Note on the request's entry whether its budget ran out and what was skipped."""
+        with self._lock:
+            entry = self.requests.get(budget.request_id)
+            if entry is not None:
+                entry["budget_exhausted"] = budget.exhausted()
+                entry["skipped"] = dict(budget.skipped)
+
+    def report(self, recent: int = 50) -> Dict[str, Any]:
+        """Budget report: totals, per-day/industry/stage/model aggregates and recent requests."""
+        def rounded(table: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+            return {key: {**value, "cost": round(value["cost"], 6)} for key, value in table.items()}
+        with self._lock:
+            requests = list(self.requests.values())[-recent:]
+            return {
+                "budget": {
+                    "brief_token_budget": int(env_float("BRIEF_TOKEN_BUDGET", 0)),
+                    "brief_cost_budget": env_float("BRIEF_COST_BUDGET", 0),
+                },
+                "total": {**self.total, "cost": round(self.total["cost"], 6)},
+                "by_day": rounded(self.by_day),
+                "by_industry": rounded(self.by_industry),
+                "by_stage": rounded(self.by_stage),
+                "by_model": rounded(self.by_model),
+                "requests": [
+                    {**entry, "cost": round(entry["cost"], 6), "stages": rounded(entry["stages"])}
+                    for entry in reversed(requests)
+                ],
+            }
+
+ledger = Ledger()
+
+_budget: contextvars.ContextVar[Optional[BriefBudget]] = contextvars.ContextVar("brief_budget", default=None)
+_stage: contextvars.ContextVar[str] = contextvars.ContextVar("cost_stage", default="generate")
+_usage: contextvars.ContextVar[Tuple[Usage, ...]] = contextvars.ContextVar("usage", default=())
+
+@contextlib.contextmanager
+def brief_budget(industry: str = "", budget: Optional[BriefBudget] = None) -> Iterator[BriefBudget]:
+    """Track the spend of one brief inside the block (and tasks it starts).
+
+    Nested scopes share the enclosing brief's budget, so a click that runs
+    several generations (captions and content ideas) spends from one budget.
+    """
+    budget = budget or current_brief_budget() or BriefBudget(industry)
+    token = _budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _budget.reset(token)
+        ledger.finish(budget)
+
+def current_brief_budget() -> Optional[BriefBudget]:
+    return _budget.get()
+
+@contextlib.contextmanager
+def usage_scope() -> Iterator[Usage]:
+    """Tally the spend of the upstream calls inside the block (and tasks it starts)."""
+    usage = Usage()
+    token = _usage.set(_usage.get() + (usage,))
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+@contextlib.contextmanager
+def cost_stage(name: str) -> Iterator[None]:
+    """Attribute upstream calls made inside the block to a pipeline stage."""
+    token = _stage.set(name)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+
+def record_usage(provider: str, model: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> float:
+    """Price one upstream response and charge it to the current brief; returns the cost."""
+    return ledger.record(current_brief_budget(), provider, model, _stage.get(), prompt_tokens or 0, completion_tokens or 0)
+
+def within_budget(stage: Optional[str] = None) -> bool:
+    """Whether the current brief may still spend; a refused `stage` is counted as skipped."""
+    budget = current_brief_budget()
+    if budget is None or not budget.exhausted():
+        return True
+    if stage:
+        budget.skip(stage)
+    return False
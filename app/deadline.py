@@ -0,0 +1,75 @@
+"""End-to-end deadlines for a click.
+
+A Deadline is created when a Gradio handler starts and travels with the click
+through generation, validation and regeneration. Every upstream call gets the
+remaining budget (capped at UPSTREAM_TIMEOUT_SECONDS) as its timeout, and the
+service skips optional work such as validation or regeneration when too little
+time is left to finish it.
+
+Configuration (environment variables):
+    REQUEST_DEADLINE_SECONDS     end-to-end budget per click (default 45)
+    UPSTREAM_TIMEOUT_SECONDS     longest single upstream call (default 30)
+    DEADLINE_VALIDATION_SECONDS  time that must remain to run validation (default 5)
+    DEADLINE_REGENERATION_SECONDS time that must remain to regenerate failed items (default 12)
+"""
+import contextlib
+import contextvars
+import time
+from typing import Iterator, Optional
+
+from env import env_float
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a click has no time left for the next upstream call."""
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def from_env(cls) -> "Deadline":
+        return cls(env_float("REQUEST_DEADLINE_SECONDS", 45))
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def allows(self, seconds: float) -> bool:
+        """Whether at least `seconds` remain."""
+        return self.remaining() >= seconds
+
+_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("deadline", default=None)
+
+@contextlib.contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """Make `deadline` the current deadline inside the block (and tasks it starts)."""
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+def current_deadline() -> Optional[Deadline]:
+    return _deadline.get()
+
+def call_timeout() -> float:
+    """Timeout for the next upstream call: the remaining budget, capped per call."""
+    limit = env_float("UPSTREAM_TIMEOUT_SECONDS", 30)
+    deadline = current_deadline()
+    if deadline is None:
+        return limit
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded(f"Request deadline of {deadline.seconds:.0f}s exceeded")
+    return min(limit, remaining)
+
+def can_validate() -> bool:
+    deadline = current_deadline()
+    return deadline is None or deadline.allows(env_float("DEADLINE_VALIDATION_SECONDS", 5))
+
+def can_regenerate() -> bool:
+    deadline = current_deadline()
+    return deadline is None or deadline.allows(env_float("DEADLINE_REGENERATION_SECONDS", 12))
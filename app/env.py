@@ -0,0 +1,18 @@
+"""Numeric settings read from environment variables.
+
+A value that is missing or does not parse falls back to the default, so a
+typo in the environment never stops the app from starting.
+"""
+import os
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
@@ -0,0 +1,157 @@
+"""Hedged requests across providers.
+
+The same prompts are implemented for GPT-4 and Claude, so a slow call to one
+provider can be raced against the other. The primary call starts alone; if it
+has not produced a valid result after a high percentile of its recently
+observed latency, the backup provider is called too. The first valid result
+wins and the other call is cancelled. Until enough latencies have been seen,
+a fixed delay is used instead of the percentile.
+
+Configuration (environment variables):
+    HEDGE                "1" enables hedging (default "0")
+    HEDGE_PERCENTILE     percentile of the primary's latency to wait before hedging (default 95)
+    HEDGE_MIN_SAMPLES    latencies needed before the percentile is trusted (default 20)
+    HEDGE_DEFAULT_DELAY  seconds to wait before hedging until then (default 8)
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from env import env_float
+from logs import get_logger
+from metrics import counter_func
+
+log = get_logger("hedge")
+
+T = TypeVar("T")
+
+def hedging_enabled() -> bool:
+    return os.getenv("HEDGE", "0") == "1"
+
+class LatencyTracker:
+    """Most recent latencies per name, for choosing when to hedge."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, name: str, pct: float) -> Optional[float]:
+        """The pct-th percentile of recent latencies, or None with too few samples."""
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if not samples or len(samples) < env_float("HEDGE_MIN_SAMPLES", 20):
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+class HedgeStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedged = 0
+        self.wins: Dict[str, int] = {}
+
+    def record(self, hedged: bool, winner: Optional[str]) -> None:
+        with self._lock:
+            self.requests += 1
+            if hedged:
+                self.hedged += 1
+            if winner is not None:
+                self.wins[winner] = self.wins.get(winner, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "hedge_rate": round(self.hedged / self.requests, 3) if self.requests else 0.0,
+                "wins": dict(self.wins),
+            }
+
+latencies = LatencyTracker()
+_stats = HedgeStats()
+
+def hedge_delay(name: str) -> float:
+    """How long to give `name` before hedging."""
+    observed = latencies.percentile(name, env_float("HEDGE_PERCENTILE", 95))
+    return env_float("HEDGE_DEFAULT_DELAY", 8) if observed is None else observed
+
+def hedge_stats() -> Dict[str, Any]:
+    return _stats.stats()
+
+counter_func("hedge_requests_total", "Calls made through hedged()", [], lambda: {(): _stats.requests})
+counter_func("hedge_hedged_total", "Calls that started a backup request", [], lambda: {(): _stats.hedged})
+counter_func("hedge_wins_total", "Hedged calls by the provider whose answer was used", ["provider"],
+             lambda: {(name,): wins for name, wins in hedge_stats()["wins"].items()})
+
+async def hedged(primary_name: str, primary: Callable[[], Awaitable[T]],
+                 backup_name: str, backup: Callable[[], Awaitable[T]],
+                 valid: Callable[[T], bool] = lambda result: True,
+                 discard: Optional[Callable[[T], Awaitable[None]]] = None) -> T:
+    """Run primary(), racing backup() against it if it is slow or fails.
+
+    Returns the first result that passes `valid`. If neither does, the last
+    invalid result is returned, or the last error raised. `discard` is awaited
+    for a losing result that completed anyway, e.g. to close a stream.
+    """
+    started = {}
+    tasks: Dict["asyncio.Future[T]", str] = {}
+
+    def start(name: str, work: Callable[[], Awaitable[T]]) -> None:
+        started[name] = time.monotonic()
+        tasks[asyncio.ensure_future(work())] = name
+
+    start(primary_name, primary)
+    delay = hedge_delay(primary_name)
+    is_hedged = False
+    last_result: Optional[T] = None
+    has_result = False
+    last_error: Optional[BaseException] = None
+    try:
+        while tasks:
+            timeout = None if is_hedged else max(0.0, started[primary_name] + delay - time.monotonic())
+            done, _ = await asyncio.wait(list(tasks), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = tasks.pop(task)
+                if task.exception() is not None:
+                    last_error = task.exception()
+                    log.warning("hedged call failed", provider=name, error=str(last_error))
+                    continue
+                latencies.record(name, time.monotonic() - started[name])
+                result = task.result()
+                if valid(result):
+                    if has_result and discard is not None:
+                        await discard(last_result)
+                    _stats.record(is_hedged, name)
+                    return result
+                if has_result and discard is not None:
+                    await discard(last_result)
+                last_result, has_result = result, True
+            if not is_hedged:
+                # The primary is slow or came back unusable: bring in the backup
+                is_hedged = True
+                if tasks:
+                    log.info("hedging slow call", primary=primary_name, backup=backup_name, delay=round(delay, 3))
+                start(backup_name, backup)
+        _stats.record(is_hedged, None)
+        if has_result:
+            return last_result
+        raise last_error
+    finally:
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                result = await task
+            except BaseException:
+                continue
+            if discard is not None:
+                await discard(result)
@@ -0,0 +1,166 @@
+"""Incremental parser for JSON answers that are still arriving.
+
+Streamed generations look like {"captions": ["...", "...  for most of their
+lifetime. ItemStreamParser is fed the text deltas as they come and reports each
+array element under one of the known keys of the top-level object as soon as
+its closing quote has arrived, so items can be shown (and generation stopped)
+before the answer is complete:
+
+    parser = ItemStreamParser(["captions", "caption_ideas"])
+    for delta in stream:
+        for key, item in parser.feed(delta):
+            show(item)
+    parser.items()  # every completed item, in order
+
+Every character is looked at once: the parser keeps its position in the
+structure (a stack of open objects and arrays) and only the text of the
+string being read, so feeding a stream costs O(n) overall and the prefix is
+never parsed again. Like the sanitizing parse tier (_parse_tiers), raw
+control characters inside strings are read as spaces, and anything before the
+first "{" (prose, a markdown fence) is skipped.
+"""
+import json
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Where a string being read may end or escape
+_STRING_SPECIAL = re.compile(r'["\\]')
+# Characters that change the parser's position in the structure
+_STRUCTURAL = re.compile(r'["{}\[\]:,]')
+_CONTROL = re.compile(r"[\x00-\x1F\x7F]")
+
+def _decode(raw: str) -> str:
+    """Unescape the text of one JSON string, reading control characters as spaces."""
+    cleaned = _CONTROL.sub(" ", raw)
+    try:
+        return json.loads(f'"{cleaned}"')
+    except ValueError:
+        # A malformed escape; keep the text as written
+        return cleaned
+
+class _Frame:
+    """An open object or array."""
+    __slots__ = ("kind", "key", "expect_key", "collect")
+
+    def __init__(self, kind: str, collect: Optional[str] = None):
+        self.kind = kind
+        # Objects: the most recent key and whether a key comes next
+        self.key: Optional[str] = None
+        self.expect_key = kind == "{"
+        # Arrays: the known key whose string elements are reported
+        self.collect = collect
+
+class ItemStreamParser:
+    def __init__(self, keys: Iterable[str]):
+        self.keys = frozenset(keys)
+        self.found: Dict[str, List[str]] = {}
+        self.chars = 0
+        # The top-level object has closed; later text is ignored
+        self.done = False
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        # Text of the current string, kept only for keys and reported items
+        self._capture: Optional[List[str]] = None
+        self._string_role: Optional[str] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        """Consume the next delta; returns the (key, item) pairs it completed."""
+        self.chars += len(chunk)
+        completed: List[Tuple[str, str]] = []
+        pos, end = 0, len(chunk)
+        while pos < end and not self.done:
+            if self._in_string:
+                pos = self._read_string(chunk, pos, completed)
+            elif not self._stack:
+                # Outside the answer: wait for the top-level object
+                start = chunk.find("{", pos)
+                if start < 0:
+                    break
+                self._stack.append(_Frame("{"))
+                pos = start + 1
+            else:
+                match = _STRUCTURAL.search(chunk, pos)
+                if match is None:
+                    break
+                self._structural(match.group())
+                pos = match.end()
+        return completed
+
+    @property
+    def depth(self) -> int:
+        """Objects and arrays still open, i.e. the brackets the answer still has to close."""
+        return len(self._stack)
+
+    def items(self, keys: Optional[Iterable[str]] = None) -> List[str]:
+        """Completed items under the given keys (default: all known keys)."""
+        wanted = self.keys if keys is None else keys
+        return [item for key, items in self.found.items() if key in wanted for item in items]
+
+    def _structural(self, char: str) -> None:
+        top = self._stack[-1]
+        if char == '"':
+            self._in_string = True
+            if top.kind == "{" and top.expect_key:
+                self._string_role = "key"
+            elif top.kind == "[" and top.collect is not None:
+                self._string_role = "item"
+            else:
+                self._string_role = None
+            self._capture = [] if self._string_role else None
+        elif char == ":":
+            if top.kind == "{":
+                top.expect_key = False
+        elif char == ",":
+            if top.kind == "{":
+                top.expect_key = True
+        elif char == "{":
+            self._stack.append(_Frame("{"))
+        elif char == "[":
+            # Only arrays directly under the top-level object hold the answer's
+            # items, as when _parse_tiers reads the finished document
+            collect = top.key if len(self._stack) == 1 and top.key in self.keys else None
+            self._stack.append(_Frame("[", collect))
+        elif char in "}]":
+            if top.kind == ("{" if char == "}" else "["):
+                self._stack.pop()
+                if not self._stack:
+                    self.done = True
+
+    def _read_string(self, chunk: str, pos: int, completed: List[Tuple[str, str]]) -> int:
+        end = len(chunk)
+        while pos < end:
+            if self._escape:
+                if self._capture is not None:
+                    self._capture.append(chunk[pos])
+                self._escape = False
+                pos += 1
+                continue
+            match = _STRING_SPECIAL.search(chunk, pos)
+            if match is None:
+                if self._capture is not None:
+                    self._capture.append(chunk[pos:])
+                return end
+            if self._capture is not None:
+                self._capture.append(chunk[pos:match.end()] if match.group() == "\\" else chunk[pos:match.start()])
+            pos = match.end()
+            if match.group() == "\\":
+                self._escape = True
+                continue
+            self._close_string(completed)
+            return pos
+        return pos
+
+    def _close_string(self, completed: List[Tuple[str, str]]) -> None:
+        self._in_string = False
+        if self._capture is None:
+            return
+        text = _decode("".join(self._capture))
+        top = self._stack[-1]
+        if self._string_role == "key":
+            top.key = text
+        else:
+            self.found.setdefault(top.collect, []).append(text)
+            completed.append((top.collect, text))
+        self._capture = None
+        self._string_role = None
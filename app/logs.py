@@ -0,0 +1,123 @@
+"""Structured logging for the service.
+
+Every module logs through get_logger(), which returns a logger that takes
+structured fields as keyword arguments:
+
+    log = get_logger("providers")
+    log.info("upstream call finished", provider="openai", model=model, seconds=0.82)
+    log.payload("raw response", text=raw)
+
+Records are put on an in-memory queue by the calling thread and written by a
+single QueueListener thread, so request threads never block on stdout/stderr.
+Secrets (API keys, bearer tokens, the configured key values themselves) are
+redacted before a record is written.
+
+Prompts, raw responses and generated items are "payload" records: they are
+logged at DEBUG and only a sampled share of them is kept, so turning on DEBUG
+under load does not flood the log.
+
+Configuration (environment variables):
+    LOG_LEVEL           DEBUG, INFO, WARNING or ERROR (default INFO)
+    LOG_FORMAT          "json" (default) or "text"
+    LOG_PAYLOAD_SAMPLE  share of payload records kept when DEBUG is on (default 0.1)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from env import env_float
+
+_SECRET_PATTERNS = [
+    re.compile(r"sk-[A-Za-z0-9_\-]{8,}"),
+    re.compile(r"(?i)bearer\s+[A-Za-z0-9_\-.=]+"),
+]
+_SECRET_ENV = ("OPENAI_API_KEY", "ANTHROPIC_API_KEY")
+_SECRET_FIELDS = {"api_key", "x-api-key", "authorization", "password", "token"}
+REDACTED = "[REDACTED]"
+
+def redact(value: Any) -> Any:
+    """Replace anything that looks like a secret in a string, list or dict."""
+    if isinstance(value, str):
+        for name in _SECRET_ENV:
+            secret = os.getenv(name)
+            if secret and len(secret) >= 8:
+                value = value.replace(secret, REDACTED)
+        for pattern in _SECRET_PATTERNS:
+            value = pattern.sub(REDACTED, value)
+        return value
+    if isinstance(value, dict):
+        return {key: REDACTED if str(key).lower() in _SECRET_FIELDS else redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(redact(entry), default=str)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", {})
+        line = f"{record.levelname} {record.name}: {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{key}={json.dumps(value, default=str)}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return redact(line)
+
+class StructuredLogger(logging.LoggerAdapter):
+    """Logger that accepts structured fields as keyword arguments."""
+
+    def process(self, msg, kwargs):
+        fields = {key: kwargs.pop(key) for key in list(kwargs) if key not in ("exc_info", "stack_info", "stacklevel", "extra")}
+        extra = dict(kwargs.pop("extra", None) or {})
+        extra["fields"] = {**extra.get("fields", {}), **fields}
+        kwargs["extra"] = extra
+        return msg, kwargs
+
+    def payload(self, msg: str, **fields) -> None:
+        """Log a verbose payload (prompt, raw response, items) at DEBUG, sampled."""
+        if self.isEnabledFor(logging.DEBUG) and random.random() < env_float("LOG_PAYLOAD_SAMPLE", 0.1):
+            self.debug(msg, **fields)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+def setup_logging() -> None:
+    """Route the service's loggers through a queue to one writer thread (idempotent)."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(TextFormatter() if os.getenv("LOG_FORMAT", "json") == "text" else JsonFormatter())
+        records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        root = logging.getLogger("mvs")
+        root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        root.addHandler(logging.handlers.QueueHandler(records))
+        root.propagate = False
+        _listener = logging.handlers.QueueListener(records, output)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+def get_logger(name: str) -> StructuredLogger:
+    setup_logging()
+    return StructuredLogger(logging.getLogger(f"mvs.{name}"), {})
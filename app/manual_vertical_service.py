@@ -1,137 +1,887 @@
+import asyncio
+import contextlib
+import contextvars
 import json
+import queue
 import re
-from typing import List, Tuple, Dict, Optional
-from json.decoder import JSONDecoder, JSONDecodeError
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Iterator, List, Tuple, Dict, Optional
 import os
-from pydantic import BaseModel
 from dotenv import load_dotenv
-from openai import OpenAI
-import requests
+from cache import cache_enabled, make_key, uncached, verdict_cache
+from costs import Usage, brief_budget, cost_stage, current_brief_budget, usage_scope, within_budget
+from singleflight import SingleFlight
+from deadline import Deadline, call_timeout, can_regenerate, can_validate, deadline_scope
+from hedge import hedged, hedging_enabled
+from json_stream import ItemStreamParser
+from retry import retry_budget, retry_stream
+from relevance import RelevanceBackend, log_verdict, make_backend
+from results_store import get_results_store, reuse_seconds
+from logs import get_logger
+from metrics import counter, counter_func, gauge_func
+from prompts import CONTENT_KINDS, generation_prompt, joint_generation_prompt, output_schema, regeneration_prompt
+from tracing import current_span, span
+from providers import call_openai_api_async, get_provider
 
 load_dotenv()
 
+log = get_logger("service")
+
+PARSE_TIER = counter("json_parse_tier_total", "Which parse tier produced the items", ["tier"])
+PARSE_OUTCOME = counter("generation_parse_total", "Generation responses by provider, output mode and parse outcome (ok / repaired / failed)", ["provider", "mode", "outcome"])
+VERDICTS = counter("relevance_verdicts_total", "Industry relevance verdicts", ["industry", "verdict"])
+EARLY_STOPS = counter("stream_early_stops_total", "Generation streams closed once every expected item had arrived", ["provider"])
+TOKENS_SAVED = counter("stream_tokens_saved_total", "Output tokens early-stopped streams still owed, i.e. the closing brackets of the answer", ["provider"])
+SECONDS_SAVED = counter("stream_seconds_saved_total", "Seconds early-stopped streams did not spend, estimated from TOKENS_SAVED at the stream's own rate", ["provider"])
+REGENERATIONS = counter("regenerations_total", "Items regenerated after failing validation", ["industry", "outcome"])
+
 # Clear proxy settings to avoid unexpected client parameters
 for _var in ("HTTP_PROXY", "HTTPS_PROXY", "http_proxy", "https_proxy"):
     os.environ.pop(_var, None)
 
-# Helper: Call OpenAI API (simple version for Hugging Face)
-def call_openai_api(messages, model="gpt-4"):
-    print("\n=== OpenAI API Call ===")
-    print(f"Model: {model}")
-    print("Messages:")
-    for msg in messages:
-        print(f"- {msg['role']}: {msg['content'][:100]}...")
-    
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        print("ERROR: OPENAI_API_KEY environment variable not set!")
-        raise ValueError("OPENAI_API_KEY environment variable not set.")
-    
-    print(f"API Key found: {api_key[:5]}...")
-    
-    client = OpenAI(api_key=api_key)
+# Background event loop that runs the async engine for the synchronous wrappers.
+# Gradio calls handlers from worker threads, so every thread submits its work to
+# this one loop instead of spinning up a loop per click.
+_engine_loop = None
+_engine_lock = threading.Lock()
+
+# Identical generations that are already running are shared instead of repeated
+_inflight = SingleFlight()
+counter_func("singleflight_calls_total", "Generations by whether they ran the work (leader) or shared another's (follower)", ["role"],
+             lambda: {("leader",): _inflight.leaders, ("follower",): _inflight.followers})
+gauge_func("singleflight_in_flight", "Generations and streams in flight", [], lambda: {(): _inflight.stats()["in_flight"]})
+
+def _get_engine_loop() -> asyncio.AbstractEventLoop:
+    global _engine_loop
+    with _engine_lock:
+        if _engine_loop is None:
+            _engine_loop = asyncio.new_event_loop()
+            threading.Thread(target=_engine_loop.run_forever, name="mvs-engine", daemon=True).start()
+        return _engine_loop
+
+def _run_sync(coro):
+    """Run a coroutine on the engine loop and block until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_engine_loop()).result()
+
+class _StreamError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+def _iterate_sync(agen: AsyncIterator) -> Iterator:
+    """Drive an async generator on the engine loop and yield its items in this thread."""
+    items: "queue.Queue" = queue.Queue()
+    done = object()
 
+    async def pump():
+        try:
+            async for item in agen:
+                items.put(item)
+        except BaseException as e:
+            items.put(_StreamError(e))
+        finally:
+            items.put(done)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), _get_engine_loop())
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=0.7,
-            max_tokens=512
-        )
-        print("API call successful!")
-        return response
-    except Exception as e:
-        print(f"API call failed: {str(e)}")
-        raise e
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, _StreamError):
+                raise item.error
+            yield item
+    finally:
+        future.cancel()
+
+# Upstream calls of one combined click share this pool (see upstream_slots)
+_upstream_slots: contextvars.ContextVar[Optional[asyncio.Semaphore]] = contextvars.ContextVar("upstream_slots", default=None)
+# Seconds spent per stage by the generation running in this task (see _stage)
+_stage_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("stage_timings", default=None)
+
+def _slot_count() -> int:
+    """Upstream calls one combined click may have in flight at once (UPSTREAM_SLOTS)."""
+    try:
+        return max(1, int(os.getenv("UPSTREAM_SLOTS", "6")))
+    except ValueError:
+        return 6
+
+@contextlib.contextmanager
+def upstream_slots(count: Optional[int] = None) -> Iterator[asyncio.Semaphore]:
+    """Make upstream calls inside the block (and tasks it starts) share `count` slots."""
+    slots = asyncio.Semaphore(count or _slot_count())
+    token = _upstream_slots.set(slots)
+    try:
+        yield slots
+    finally:
+        _upstream_slots.reset(token)
+
+@contextlib.asynccontextmanager
+async def _upstream_slot():
+    """Hold one of the current click's upstream slots, if it has a pool."""
+    slots = _upstream_slots.get()
+    if slots is None:
+        yield
+        return
+    async with slots:
+        yield
+
+@contextlib.contextmanager
+def _stage(name: str) -> Iterator[None]:
+    """Attribute the block's upstream spend to a stage and add its duration to the stage timings."""
+    started = time.perf_counter()
+    try:
+        with cost_stage(name):
+            yield
+    finally:
+        timings = _stage_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+def _early_stop_enabled() -> bool:
+    """Whether a generation stream is closed once every expected item has arrived (STREAM_EARLY_STOP, default on)."""
+    return os.getenv("STREAM_EARLY_STOP", "1") != "0"
+
+def _candidate_count() -> int:
+    """Items to ask for per generation; more than 3 enables over-generation (OVERGENERATE_CANDIDATES)."""
+    try:
+        return max(3, int(os.getenv("OVERGENERATE_CANDIDATES", "3")))
+    except ValueError:
+        return 3
+
+async def _complete_async(model_choice: str, system: str, text: str, schema: Optional[dict] = None) -> str:
+    """Run one prompt against the chosen provider and return the completion text."""
+    async with _upstream_slot():
+        return await get_provider(model_choice).complete(system, text, schema)
+
+async def _regenerate_async(model_choice: str, kind: str, industry: str, text: str) -> str:
+    """Ask for a replacement item; its prompt repeats, so the response cache would return the same text every time."""
+    with uncached():
+        return await _complete_async(model_choice, regeneration_prompt(kind, industry), text)
+
+# Provider that a slow call is hedged with
+HEDGE_PARTNERS = {"gpt-4": "claude", "claude": "gpt-4"}
+
+def _is_fallback(items: List[str]) -> bool:
+    """Whether parsing gave up and returned its default ideas."""
+    return all(item.startswith("Default idea ") for item in items)
+
+async def _generate_candidates_async(model_choice: str, kind: str, industry: str, text: str) -> List[str]:
+    """Generate and parse the first round of items, hedging across providers when HEDGE=1."""
+    keys_by_kind = {kind: CONTENT_KINDS[kind]["keys"]}
+    count = _candidate_count()
+    system = generation_prompt(kind, industry, count)
+
+    async def generate(choice: str) -> List[str]:
+        raw = await _complete_async(choice, system, text, output_schema((kind,)))
+        log.payload("raw response", provider=choice, kind=kind, text=raw)
+        return _parse_generation(raw, choice, keys_by_kind, count, 3)[kind]
+
+    other = HEDGE_PARTNERS.get(model_choice)
+    if not hedging_enabled() or other is None:
+        return await generate(model_choice)
+    return await hedged(model_choice, lambda: generate(model_choice), other, lambda: generate(other),
+                        valid=lambda items: not _is_fallback(items))
+
+async def _generate_joint_candidates_async(model_choice: str, industry: str, text: str) -> Dict[str, List[str]]:
+    """Generate the first round of every kind with one prompt, hedging across providers when HEDGE=1."""
+    keys_by_kind = {kind: spec["keys"] for kind, spec in CONTENT_KINDS.items()}
+    count = _candidate_count()
+    system = joint_generation_prompt(industry, count)
+
+    async def generate(choice: str) -> Dict[str, List[str]]:
+        raw = await _complete_async(choice, system, text, output_schema(tuple(keys_by_kind)))
+        log.payload("raw response", provider=choice, kind="joint", text=raw)
+        return _parse_generation(raw, choice, keys_by_kind, count, 3)
+
+    other = HEDGE_PARTNERS.get(model_choice)
+    if not hedging_enabled() or other is None:
+        return await generate(model_choice)
+    return await hedged(model_choice, lambda: generate(model_choice), other, lambda: generate(other),
+                        valid=lambda groups: not any(_is_fallback(items) for items in groups.values()))
+
+async def _bounded_stream(stream: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Give every step of a stream the remaining deadline as its timeout."""
+    try:
+        while True:
+            try:
+                delta = await asyncio.wait_for(stream.__anext__(), call_timeout())
+            except StopAsyncIteration:
+                return
+            yield delta
+    finally:
+        await stream.aclose()
+
+async def _hedged_stream_async(model_choice: str, system: str, text: str, schema: Optional[dict] = None) -> AsyncIterator[str]:
+    """Stream from whichever provider produces its first delta first."""
+    async def open_stream(choice: str) -> Tuple[str, AsyncIterator[str]]:
+        stream = _stream_async(choice, system, text, schema)
+        async for first in stream:
+            return first, stream
+        return "", stream
+
+    async def close(opened: Tuple[str, AsyncIterator[str]]) -> None:
+        await opened[1].aclose()
+
+    other = HEDGE_PARTNERS.get(model_choice)
+    if other is None:
+        # Nothing to hedge with (e.g. the mock provider): stream as usual
+        stream = _stream_async(model_choice, system, text, schema)
+        try:
+            async for delta in stream:
+                yield delta
+        finally:
+            await stream.aclose()
+        return
+    first, stream = await hedged(f"{model_choice} stream", lambda: open_stream(model_choice),
+                                 f"{other} stream", lambda: open_stream(other), discard=close)
+    try:
+        yield first
+        async for delta in stream:
+            yield delta
+    finally:
+        await stream.aclose()
 
-def _robust_json_parse(raw_str, keys, expected_count=3):
-    import re, json
+def _stream_async(model_choice: str, system: str, text: str, schema: Optional[dict] = None) -> AsyncIterator[str]:
+    """Stream one prompt from the chosen provider, retrying if it fails before the first delta."""
+    provider = get_provider(model_choice)
+    return retry_stream(lambda: _bounded_stream(provider.stream(system, text, schema)), f"{provider.display_name} stream")
+
+@contextlib.contextmanager
+def _click_scope(deadline: Optional[Deadline] = None, industry: str = "") -> Iterator[None]:
+    """One click's deadline, token budget and a retry budget shared by all of its upstream calls."""
+    with retry_budget(), deadline_scope(deadline), brief_budget(industry):
+        yield
+
+async def _run_click(coro: Awaitable, deadline: Optional[Deadline] = None, industry: str = ""):
+    """Run one click's work inside its _click_scope."""
+    with _click_scope(deadline, industry):
+        return await coro
+
+async def _run_click_stream(stream: AsyncIterator, deadline: Optional[Deadline] = None, industry: str = "") -> AsyncIterator:
+    """Iterate one click's stream inside its _click_scope."""
+    with _click_scope(deadline, industry):
+        async for item in stream:
+            yield item
+
+def _items_under(data, keys, expected_count, min_count):
+    """The first list under one of the keys with an acceptable length, or None."""
+    if not isinstance(data, dict):
+        return None
+    for key in keys:
+        ideas = data.get(key)
+        if isinstance(ideas, list) and min_count <= len(ideas) <= expected_count:
+            return ideas
+    return None
+
+def _json_tiers(raw_str):
+    """Yield (tier, parsed object) for each JSON tier that parses."""
     # Tier 1: Try direct JSON parse
     try:
         data = json.loads(raw_str)
-        for key in keys:
-            ideas = data.get(key)
-            if isinstance(ideas, list) and len(ideas) == expected_count:
-                return ideas
     except Exception:
         pass
+    else:
+        yield "json", data
     # Tier 2: Sanitize and try again
     cleaned = re.sub(r"[\x00-\x1F\x7F]", " ", raw_str).strip()
     try:
         data = json.loads(cleaned)
-        for key in keys:
-            ideas = data.get(key)
-            if isinstance(ideas, list) and len(ideas) == expected_count:
-                return ideas
     except Exception:
         pass
+    else:
+        yield "sanitized_json", data
+
+def _parse_tiers(raw_str, keys, expected_count, min_count):
+    """Return the name of the first parse tier that succeeded and its items."""
+    min_count = expected_count if min_count is None else min_count
+    for tier, data in _json_tiers(raw_str):
+        ideas = _items_under(data, keys, expected_count, min_count)
+        if ideas is not None:
+            return tier, ideas
     # Tier 3: Regex fallback for bullet/numbered lists
     bullets = re.findall(r"[-•*]\s*(.+)", raw_str)
-    if len(bullets) == expected_count:
-        return [b.strip() for b in bullets]
+    if min_count <= len(bullets) <= expected_count:
+        return "bullets", [b.strip() for b in bullets]
     numbers = re.split(r"\d+\.\s*", raw_str)
     numbered = [n.strip() for n in numbers if n.strip()]
-    if len(numbered) == expected_count:
-        return numbered
+    if min_count <= len(numbered) <= expected_count:
+        return "numbered", numbered
     # Fallback
-    return [f"Default idea {i+1}" for i in range(expected_count)]
+    return "default", [f"Default idea {i+1}" for i in range(min_count)]
 
-def validate_industry_relevance(text: str, industry: str) -> bool:
-    """Validate if the generated content is relevant to the specified industry."""
+def _parse_group_tiers(raw_str, keys_by_kind, expected_count, min_count):
+    """Return (tier, items) per kind; a kind no JSON tier yields gets the default ideas."""
+    found = {}
+    for tier, data in _json_tiers(raw_str):
+        for kind, keys in keys_by_kind.items():
+            if kind not in found:
+                ideas = _items_under(data, keys, expected_count, min_count)
+                if ideas is not None:
+                    found[kind] = (tier, ideas)
+        if len(found) == len(keys_by_kind):
+            break
+    return {kind: found.get(kind, ("default", [f"Default idea {i+1}" for i in range(min_count)])) for kind in keys_by_kind}
+
+def _decode_structured(raw_str, kinds, expected_count, min_count):
+    """Decode an answer that should match output_schema(kinds); None if it does not."""
+    try:
+        data = json.loads(raw_str)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    groups = {}
+    for kind in kinds:
+        ideas = data.get(kind)
+        if not isinstance(ideas, list) or not min_count <= len(ideas) <= expected_count:
+            return None
+        if not all(isinstance(idea, str) and idea.strip() for idea in ideas):
+            return None
+        groups[kind] = ideas
+    return groups
+
+def _parse_generation(raw_str: str, provider: str, keys_by_kind: Dict[str, List[str]], expected_count: int, min_count: int) -> Dict[str, List[str]]:
+    """Items per kind from a generation answer, counting how it parsed per provider.
+
+    Answers the provider held to the schema (json_schema, tool use) take one
+    json.loads plus a schema check; anything else, or an answer that fails the
+    check, goes through the parse tiers. Outcomes: "ok" (parsed as is),
+    "repaired" (needed sanitizing or list scraping) and "failed" (default ideas,
+    i.e. a wasted generation).
+    """
+    mode = get_provider(provider).output_mode()
+    with span("parse", chars=len(raw_str), mode=mode) as current:
+        if mode != "prompt":
+            groups = _decode_structured(raw_str, list(keys_by_kind), expected_count, min_count)
+            if groups is not None:
+                PARSE_TIER.inc(len(groups), tier="structured")
+                PARSE_OUTCOME.inc(provider=provider, mode=mode, outcome="ok")
+                current.set(tier="structured")
+                return groups
+        if len(keys_by_kind) == 1:
+            kind, keys = next(iter(keys_by_kind.items()))
+            parsed = {kind: _parse_tiers(raw_str, keys, expected_count, min_count)}
+        else:
+            parsed = _parse_group_tiers(raw_str, keys_by_kind, expected_count, min_count)
+        tiers = [tier for tier, _ in parsed.values()]
+        for tier in tiers:
+            PARSE_TIER.inc(tier=tier)
+        # A structured answer that failed the schema check was not usable as is
+        outcome = "failed" if "default" in tiers else "ok" if mode == "prompt" and all(tier == "json" for tier in tiers) else "repaired"
+        PARSE_OUTCOME.inc(provider=provider, mode=mode, outcome=outcome)
+        if outcome != "ok":
+            log.info("generation answer needed fallback parsing", provider=provider, mode=mode, tiers=tiers)
+        current.set(tier=",".join(tiers), outcome=outcome)
+        return {kind: ideas for kind, (_, ideas) in parsed.items()}
+
+async def _llm_relevance_async(text: str, industry: str) -> bool:
+    """Ask the LLM whether a single text is relevant to the industry."""
     try:
-        response = call_openai_api([
-            {"role": "system", "content": f"You are an industry expert. Evaluate if the following content is relevant to the {industry} industry. Consider industry-specific terminology, themes, and context. Return ONLY a JSON object with a single boolean field 'is_relevant'."},
-            {"role": "user", "content": text}
-        ], model="gpt-4")
-        
+        async with _upstream_slot():
+            response = await call_openai_api_async([
+                {"role": "system", "content": f"You are an industry expert. Evaluate if the following content is relevant to the {industry} industry. Consider industry-specific terminology, themes, and context. Return ONLY a JSON object with a single boolean field 'is_relevant'."},
+                {"role": "user", "content": text}
+            ], model="gpt-4")
+
         result = json.loads(response.choices[0].message.content)
-        return result.get('is_relevant', False)
+        is_relevant = result.get('is_relevant', False)
+        _record_verdict(text, industry, is_relevant)
+        return is_relevant
     except Exception as e:
-        print(f"Error in validate_industry_relevance: {str(e)}")
+        log.warning("relevance validation failed, assuming relevant", industry=industry, error=str(e))
         return True  # Default to True if validation fails
 
-def generate_caption_ideas(text: str, industry: str) -> List[str]:
-    """Generate caption ideas based on the brief."""
-    print(f"\n=== Generating Captions for {industry} ===")
+def _parse_batch_verdicts(raw_str: str, count: int) -> Optional[List[bool]]:
+    """Parse a batch verdict response into one boolean per item, or None if unusable."""
+    cleaned = re.sub(r"[\x00-\x1F\x7F]", " ", raw_str).strip()
     try:
-        response = call_openai_api([
-            {"role": "system", "content": f"You are a creative strategist for a digital agency specializing in {industry}. Based on the following campaign brief, generate exactly three short, engaging caption ideas for social media posts. Each caption MUST be specifically relevant to the {industry} industry. Return ONLY a valid JSON object with a single key: 'captions', whose value is an array of three strings. No commentary, no extra fields, no markdown, no code block."},
-            {"role": "user", "content": text}
-        ], model="gpt-4")
-        
-        arguments_str = response.choices[0].message.content
-        print(f"Raw response: {arguments_str}")
-        captions = _robust_json_parse(arguments_str, ["captions", "caption_ideas"], 3)
-        
-        # Validate each caption and regenerate failed ones
-        final_captions = []
-        for i, caption in enumerate(captions):
-            if validate_industry_relevance(caption, industry):
-                final_captions.append(caption)
+        data = json.loads(cleaned)
+    except Exception:
+        return None
+    verdicts = data.get("verdicts") if isinstance(data, dict) else data
+    if not isinstance(verdicts, list) or len(verdicts) != count:
+        return None
+    results: List[Optional[bool]] = [None] * count
+    for position, verdict in enumerate(verdicts):
+        if isinstance(verdict, bool):
+            results[position] = verdict
+        elif isinstance(verdict, dict) and isinstance(verdict.get("is_relevant"), bool):
+            index = verdict.get("index", position + 1)
+            if not isinstance(index, int) or not 1 <= index <= count:
+                return None
+            results[index - 1] = verdict["is_relevant"]
+        else:
+            return None
+    if any(result is None for result in results):
+        return None
+    return results
+
+async def _llm_relevance_batch_async(texts: List[str], industry: str) -> List[bool]:
+    """Judge several texts with the LLM, reusing cached verdicts per (industry, text)."""
+    if not texts:
+        return []
+    verdicts: List[Optional[bool]] = [None] * len(texts)
+    if cache_enabled():
+        verdicts = [verdict_cache.get(make_key("verdict", industry, text)) for text in texts]
+    pending = [i for i, verdict in enumerate(verdicts) if verdict is None]
+    if pending:
+        fresh = await _llm_relevance_uncached_async([texts[i] for i in pending], industry)
+        for i, verdict in zip(pending, fresh):
+            verdicts[i] = verdict
+    return verdicts
+
+def _record_verdict(text: str, industry: str, is_relevant: bool) -> None:
+    """Remember a verdict the LLM actually returned (not an error fallback)."""
+    log_verdict(text, industry, is_relevant)
+    if cache_enabled():
+        verdict_cache.set(make_key("verdict", industry, text), is_relevant)
+
+async def _llm_relevance_uncached_async(texts: List[str], industry: str) -> List[bool]:
+    """Ask the LLM to judge several texts for industry relevance in a single call.
+
+    Falls back to one call per text only if the batch response cannot be parsed.
+    """
+    if len(texts) == 1:
+        return [await _llm_relevance_async(texts[0], industry)]
+    numbered = "\n".join(f"{i + 1}. {json.dumps(text)}" for i, text in enumerate(texts))
+    try:
+        async with _upstream_slot():
+            response = await call_openai_api_async([
+                {"role": "system", "content": f"You are an industry expert. Evaluate whether each of the following numbered content items is relevant to the {industry} industry. Consider industry-specific terminology, themes, and context. Return ONLY a JSON object with a single key 'verdicts', whose value is an array with one object per item, in order, of the form {{\"index\": <item number>, \"is_relevant\": <boolean>}}."},
+                {"role": "user", "content": numbered}
+            ], model="gpt-4")
+        verdicts = _parse_batch_verdicts(response.choices[0].message.content, len(texts))
+        if verdicts is not None:
+            for text, is_relevant in zip(texts, verdicts):
+                _record_verdict(text, industry, is_relevant)
+            return verdicts
+        log.info("could not parse batch relevance verdicts, validating items individually", industry=industry, items=len(texts))
+    except Exception as e:
+        log.warning("batch relevance validation failed, assuming relevant", industry=industry, error=str(e))
+        return [True] * len(texts)  # Default to True if validation fails
+    return list(await asyncio.gather(*(_llm_relevance_async(text, industry) for text in texts)))
+
+_relevance_backend: Optional[RelevanceBackend] = None
+
+def get_relevance_backend() -> RelevanceBackend:
+    """Return the relevance backend selected by RELEVANCE_BACKEND (llm, local or hybrid)."""
+    global _relevance_backend
+    if _relevance_backend is None:
+        _relevance_backend = make_backend(os.getenv("RELEVANCE_BACKEND", "hybrid"), _llm_relevance_batch_async)
+    return _relevance_backend
+
+def set_relevance_backend(backend: Optional[RelevanceBackend]) -> None:
+    """Replace the relevance backend; None re-reads RELEVANCE_BACKEND on next use."""
+    global _relevance_backend
+    _relevance_backend = backend
+
+async def validate_industry_relevance_async(text: str, industry: str) -> bool:
+    """Validate if the generated content is relevant to the specified industry."""
+    return (await validate_industry_relevance_batch_async([text], industry))[0]
+
+def validate_industry_relevance(text: str, industry: str) -> bool:
+    """Validate if the generated content is relevant to the specified industry."""
+    return _run_sync(validate_industry_relevance_async(text, industry))
+
+async def validate_industry_relevance_batch_async(texts: List[str], industry: str) -> List[bool]:
+    """Validate several texts for industry relevance.
+
+    Confident items are judged by the local model; the rest go to the LLM in a
+    single batched call (see relevance.py).
+    """
+    if not texts:
+        return []
+    with span("validate", industry=industry, items=len(texts)) as current, _stage("validate"):
+        verdicts = await get_relevance_backend().validate(texts, industry)
+        for is_relevant in verdicts:
+            VERDICTS.inc(industry=industry, verdict="pass" if is_relevant else "fail")
+        current.set(passed=sum(1 for is_relevant in verdicts if is_relevant))
+        return verdicts
+
+def validate_industry_relevance_batch(texts: List[str], industry: str) -> List[bool]:
+    """Validate several texts for industry relevance."""
+    return _run_sync(validate_industry_relevance_batch_async(texts, industry))
+
+async def score_industry_relevance_batch_async(texts: List[str], industry: str) -> List[float]:
+    """Relevance scores in [0, 1] for several texts; >= 0.5 counts as relevant."""
+    if not texts:
+        return []
+    with span("validate", industry=industry, items=len(texts), mode="score") as current, _stage("validate"):
+        scores = await get_relevance_backend().score(texts, industry)
+        for score in scores:
+            VERDICTS.inc(industry=industry, verdict="pass" if score >= 0.5 else "fail")
+        current.set(passed=sum(1 for score in scores if score >= 0.5))
+        return scores
+
+def score_industry_relevance_batch(texts: List[str], industry: str) -> List[float]:
+    """Relevance scores in [0, 1] for several texts; >= 0.5 counts as relevant."""
+    return _run_sync(score_industry_relevance_batch_async(texts, industry))
+
+def _may_validate(label: str, what: str = "validation") -> bool:
+    """Whether the click has the time and token budget left to validate."""
+    if not can_validate():
+        log.info(f"deadline near, skipping {what}", label=label)
+        return False
+    if not within_budget("validate"):
+        log.info(f"brief budget exhausted, skipping {what}", label=label)
+        return False
+    return True
+
+def _may_regenerate(label: str) -> bool:
+    """Whether the click has the time and token budget left to regenerate."""
+    if not can_regenerate():
+        log.info("deadline near, skipping regeneration", label=label)
+        return False
+    if not within_budget("regenerate"):
+        log.info("brief budget exhausted, skipping regeneration", label=label)
+        return False
+    return True
+
+async def _select_best(candidates: List[str], industry: str, regenerate: Callable[[], Awaitable[str]], label: str, want: int = 3) -> Tuple[List[str], List[Optional[bool]]]:
+    """Pick the `want` most relevant of several over-generated candidates.
+
+    All candidates are scored in one batch. Only if fewer than `want` pass is
+    the shortfall regenerated concurrently and validated in a second batch, so
+    the worst case is two generation and two validation round trips.
+    """
+    if not _may_validate(label):
+        return candidates[:want], [None] * len(candidates[:want])
+    scores = await score_industry_relevance_batch_async(candidates, industry)
+    ranked = sorted(range(len(candidates)), key=lambda i: -scores[i])
+    selected = [candidates[i] for i in ranked if scores[i] >= 0.5][:want]
+    rejected = [candidates[i] for i in ranked if scores[i] < 0.5]
+    log.info("over-generated candidates validated", label=label, industry=industry, relevant=len(selected), candidates=len(candidates))
+    if len(selected) == want:
+        return selected, [True] * want
+
+    if _may_regenerate(label):
+        with span("regenerate", industry=industry, items=want - len(selected)), _stage("regenerate"):
+            regenerated = await asyncio.gather(*(regenerate() for _ in range(want - len(selected))), return_exceptions=True)
+        replacements = []
+        for result in regenerated:
+            REGENERATIONS.inc(industry=industry, outcome="error" if isinstance(result, Exception) else "ok")
+            if isinstance(result, Exception):
+                log.warning("regeneration failed", label=label, error=str(result))
             else:
-                print(f"Caption not relevant to {industry}: {caption}")
-                # Regenerate just this caption
-                try:
-                    response = call_openai_api([
-                        {"role": "system", "content": f"You are a creative strategist for a digital agency specializing in {industry}. Generate ONE short, engaging caption idea for social media posts that is specifically relevant to the {industry} industry. Return ONLY the caption text, with no additional formatting or structure."},
-                        {"role": "user", "content": text}
-                    ], model="gpt-4")
-                    
-                    new_caption = response.choices[0].message.content.strip()
-                    if validate_industry_relevance(new_caption, industry):
-                        final_captions.append(new_caption)
-                    else:
-                        print(f"Regenerated caption still not relevant to {industry}: {new_caption}")
-                        final_captions.append(f"{new_caption} (low relevance)")
-                except Exception as e:
-                    print(f"Error regenerating caption: {str(e)}")
-                    final_captions.append(f"{caption} (low relevance)")
-        
-        print(f"Final captions: {final_captions}")
-        return final_captions
+                replacements.append(result.strip())
+        if replacements and _may_validate(label, "validation of regenerated items"):
+            new_verdicts = await validate_industry_relevance_batch_async(replacements, industry)
+            for new_item, is_relevant in zip(replacements, new_verdicts):
+                if is_relevant:
+                    selected.append(new_item)
+                else:
+                    log.info("regenerated item still not relevant", label=label, industry=industry)
+                    log.payload("irrelevant regenerated item", label=label, item=new_item)
+                    rejected.append(new_item)
+        else:
+            rejected.extend(replacements)
+    # Fill any remaining slots with the highest-scoring rejects
+    verdicts: List[Optional[bool]] = [True] * len(selected)
+    for item in rejected[:want - len(selected)]:
+        selected.append(f"{item} (low relevance)")
+        verdicts.append(False)
+    return selected, verdicts
+
+async def _validate_and_regenerate(items: List[str], industry: str, regenerate: Callable[[], Awaitable[str]], label: str) -> Tuple[List[str], List[Optional[bool]]]:
+    """Validate all items in one batch and regenerate the ones that fail.
+
+    Failed items are regenerated concurrently and the replacements are
+    validated together in a second batch. When more than three items were
+    over-generated, the best three are selected instead (see _select_best).
+    Returns the final items and their verdicts (None where validation was
+    skipped).
+    """
+    if len(items) > 3:
+        return await _select_best(items, industry, regenerate, label)
+    return await _validate_items(items, industry, lambda i: regenerate(), label)
+
+async def _validate_items(items: List[str], industry: str, regenerate: Callable[[int], Awaitable[str]], label: str) -> Tuple[List[str], List[Optional[bool]]]:
+    """Validate items in one batch; regenerate(i) produces a replacement for failed item i."""
+    final_items = list(items)
+    if not _may_validate(label):
+        return final_items, [None] * len(items)
+    verdicts = await validate_industry_relevance_batch_async(items, industry)
+    final_verdicts: List[Optional[bool]] = list(verdicts)
+    failed = [i for i, is_relevant in enumerate(verdicts) if not is_relevant]
+    if not failed:
+        return final_items, final_verdicts
+    log.info("items not relevant", label=label, industry=industry, failed=len(failed), total=len(items))
+    log.payload("irrelevant items", label=label, items=[items[i] for i in failed])
+    if not _may_regenerate(label):
+        for i in failed:
+            final_items[i] = f"{items[i]} (low relevance)"
+        return final_items, final_verdicts
+
+    with span("regenerate", industry=industry, items=len(failed)), _stage("regenerate"):
+        regenerated = await asyncio.gather(*(regenerate(i) for i in failed), return_exceptions=True)
+    replacements = {}
+    for i, result in zip(failed, regenerated):
+        REGENERATIONS.inc(industry=industry, outcome="error" if isinstance(result, Exception) else "ok")
+        if isinstance(result, Exception):
+            log.warning("regeneration failed", label=label, error=str(result))
+            final_items[i] = f"{items[i]} (low relevance)"
+        else:
+            replacements[i] = result.strip()
+
+    if not _may_validate(label, "validation of regenerated items"):
+        for i, new_item in replacements.items():
+            final_items[i] = f"{new_item} (low relevance)"
+            final_verdicts[i] = None
+        return final_items, final_verdicts
+    new_verdicts = await validate_industry_relevance_batch_async(list(replacements.values()), industry)
+    for (i, new_item), is_relevant in zip(replacements.items(), new_verdicts):
+        final_verdicts[i] = is_relevant
+        if is_relevant:
+            final_items[i] = new_item
+        else:
+            log.info("regenerated item still not relevant", label=label, industry=industry)
+            log.payload("irrelevant regenerated item", label=label, item=new_item)
+            final_items[i] = f"{new_item} (low relevance)"
+    return final_items, final_verdicts
+
+def _store_result(kind: str, text: str, industry: str, model_choice: str, items: List[str], verdicts: List[Optional[bool]],
+                  latencies: Dict[str, float], stream: bool, usage: Optional[Usage]) -> None:
+    """Queue a finished generation for the results store (no-op unless RESULTS_DB is set).
+
+    usage is what this generation spent, not the whole click; None stores zero.
+    """
+    store = get_results_store()
+    if store is None:
+        return
+    budget = current_brief_budget()
+    store.record(
+        text, industry, model_choice, kind, items,
+        verdicts=verdicts,
+        latencies={name: round(seconds, 4) for name, seconds in latencies.items()},
+        prompt_tokens=usage.prompt_tokens if usage else 0,
+        completion_tokens=usage.completion_tokens if usage else 0,
+        cost=usage.cost if usage else 0.0,
+        request_id=budget.request_id if budget else None,
+        stream=stream,
+    )
+
+async def _reused_result(kind: str, text: str, industry: str, model_choice: str) -> Optional[List[str]]:
+    """Items stored for the same brief, industry, model and kind within RESULTS_REUSE_SECONDS."""
+    store = get_results_store()
+    if store is None or reuse_seconds() <= 0:
+        return None
+    try:
+        previous = await asyncio.to_thread(store.latest, text, industry, model_choice, kind, reuse_seconds())
     except Exception as e:
-        print(f"Error in generate_caption_ideas: {str(e)}")
-        raise e
+        log.warning("results store lookup failed", error=str(e))
+        return None
+    if previous is None:
+        return None
+    log.info("reusing stored result", kind=kind, industry=industry, provider=model_choice, request_id=previous["request_id"])
+    return previous["items"]
+
+def _placeholders(model_choice: str, kind: str) -> List[str]:
+    """Stand-in items for providers that return placeholders instead of raising."""
+    return [f"{get_provider(model_choice).display_name} {CONTENT_KINDS[kind]['fallback']} {i+1}" for i in range(3)]
+
+def is_placeholder(model_choice: str, kind: str, items: List[str]) -> bool:
+    """Whether items are the stand-ins a placeholder_on_error provider returned after a failure."""
+    return list(items) == _placeholders(model_choice, kind)
+
+async def _generate_ideas_async(kind: str, text: str, industry: str, model_choice: str) -> List[str]:
+    """Generate, validate and regenerate captions or content ideas with one provider."""
+    spec = CONTENT_KINDS[kind]
+    provider = get_provider(model_choice)
+    started = time.perf_counter()
+    log.info("generating", kind=kind, industry=industry, provider=provider.name)
+    with usage_scope() as usage:
+        try:
+            with _stage("generate"):
+                items = await _generate_candidates_async(model_choice, kind, industry, text)
+
+            async def regenerate() -> str:
+                return await _regenerate_async(model_choice, kind, industry, text)
+
+            # Validate all items in one batch, regenerating failed ones
+            final_items, verdicts = await _validate_and_regenerate(items, industry, regenerate, f"{provider.display_name} {spec['label']}")
+
+            seconds = time.perf_counter() - started
+            log.info("generation finished", kind=kind, industry=industry, provider=provider.name, seconds=round(seconds, 3))
+            log.payload("final items", kind=kind, items=final_items)
+            _store_result(kind, text, industry, model_choice, final_items, verdicts, {"total": seconds}, stream=False, usage=usage)
+            return final_items
+        except Exception as e:
+            if not provider.placeholder_on_error:
+                log.error("generation failed", kind=kind, provider=provider.name, error=str(e))
+                raise e
+            log.error("generation failed, returning placeholders", kind=kind, provider=provider.name, error=str(e))
+            return _placeholders(model_choice, kind)
+
+async def _generate_joint_async(text: str, industry: str, model_choice: str) -> Dict[str, List[str]]:
+    """Generate every kind from one upstream call and validate all items in one batch."""
+    provider = get_provider(model_choice)
+    label = f"{provider.display_name} joint"
+    started = time.perf_counter()
+    log.info("generating jointly", industry=industry, provider=provider.name)
+    with usage_scope() as usage:
+        try:
+            with _stage("generate"):
+                groups = await _generate_joint_candidates_async(model_choice, industry, text)
+                missing = [kind for kind, items in groups.items() if _is_fallback(items)]
+                if missing:
+                    # The joint answer lacked a kind; ask for it on its own
+                    log.warning("joint response missing kinds, generating them separately", kinds=missing, provider=provider.name)
+                    separate = await asyncio.gather(*(_generate_candidates_async(model_choice, kind, industry, text) for kind in missing))
+                    groups.update(zip(missing, separate))
+
+            def regenerate(kind: str) -> Callable[[], Awaitable[str]]:
+                async def regenerate_one() -> str:
+                    return await _regenerate_async(model_choice, kind, industry, text)
+                return regenerate_one
+
+            kinds = list(groups)
+            if any(len(groups[kind]) > 3 for kind in kinds):
+                # Over-generated candidates are ranked within their own kind
+                selected = await asyncio.gather(*(_validate_and_regenerate(groups[kind], industry, regenerate(kind), f"{provider.display_name} {CONTENT_KINDS[kind]['label']}") for kind in kinds))
+                final = {kind: items for kind, (items, _) in zip(kinds, selected)}
+                verdicts = {kind: kind_verdicts for kind, (_, kind_verdicts) in zip(kinds, selected)}
+            else:
+                owners = [kind for kind in kinds for _ in groups[kind]]
+                regenerators = {kind: regenerate(kind) for kind in kinds}
+                validated, all_verdicts = await _validate_items([item for kind in kinds for item in groups[kind]], industry,
+                                                                lambda i: regenerators[owners[i]](), label)
+                final, verdicts, offset = {}, {}, 0
+                for kind in kinds:
+                    final[kind] = validated[offset:offset + len(groups[kind])]
+                    verdicts[kind] = all_verdicts[offset:offset + len(groups[kind])]
+                    offset += len(groups[kind])
+
+            seconds = time.perf_counter() - started
+            log.info("joint generation finished", industry=industry, provider=provider.name, seconds=round(seconds, 3))
+            log.payload("final items", kind="joint", items=final)
+            # One upstream answer served every kind, so its spend is stored once, on the first row
+            for i, (kind, items) in enumerate(final.items()):
+                _store_result(kind, text, industry, model_choice, items, verdicts[kind], {"total": seconds}, stream=False,
+                              usage=usage if i == 0 else None)
+            return final
+        except Exception as e:
+            if not provider.placeholder_on_error:
+                log.error("joint generation failed", provider=provider.name, error=str(e))
+                raise e
+            log.error("joint generation failed, returning placeholders", provider=provider.name, error=str(e))
+            return {kind: _placeholders(model_choice, kind) for kind in CONTENT_KINDS}
+
+async def generate_ideas_async(kind: str, text: str, industry: str, model_choice: str, deadline: Optional[Deadline] = None) -> List[str]:
+    """Generate captions or content ideas ("captions" / "content_ideas") with the chosen provider."""
+    with span("generate", kind=kind, industry=industry, model=model_choice, stream=False) as current:
+        reused = await _reused_result(kind, text, industry, model_choice)
+        if reused is not None:
+            current.set(items=len(reused), reused=True)
+            return reused
+        result = await _inflight.do(("generate", kind, text, industry, model_choice), lambda: _run_click(_generate_ideas_async(kind, text, industry, model_choice), deadline, industry))
+        current.set(items=len(result))
+        return list(result)
+
+def generate_ideas(kind: str, text: str, industry: str, model_choice: str, deadline: Optional[Deadline] = None) -> List[str]:
+    """Generate captions or content ideas ("captions" / "content_ideas") with the chosen provider."""
+    return _run_sync(generate_ideas_async(kind, text, industry, model_choice, deadline))
+
+async def generate_caption_ideas_async(text: str, industry: str, deadline: Optional[Deadline] = None) -> List[str]:
+    """Generate caption ideas based on the brief."""
+    return await generate_ideas_async("captions", text, industry, "gpt-4", deadline)
+
+def generate_caption_ideas(text: str, industry: str, deadline: Optional[Deadline] = None) -> List[str]:
+    """Generate caption ideas based on the brief."""
+    return generate_ideas("captions", text, industry, "gpt-4", deadline)
+
+async def generate_content_ideas_async(text: str, industry: str, deadline: Optional[Deadline] = None) -> List[str]:
+    """Generate content ideas based on the brief."""
+    return await generate_ideas_async("content_ideas", text, industry, "gpt-4", deadline)
+
+def generate_content_ideas(text: str, industry: str, deadline: Optional[Deadline] = None) -> List[str]:
+    """Generate content ideas based on the brief."""
+    return generate_ideas("content_ideas", text, industry, "gpt-4", deadline)
+
+async def generate_caption_ideas_claude_async(text: str, industry: str, deadline: Optional[Deadline] = None) -> list:
+    """Generate caption ideas using Claude API."""
+    return await generate_ideas_async("captions", text, industry, "claude", deadline)
+
+def generate_caption_ideas_claude(text: str, industry: str, deadline: Optional[Deadline] = None) -> list:
+    """Generate caption ideas using Claude API."""
+    return generate_ideas("captions", text, industry, "claude", deadline)
+
+async def generate_content_ideas_claude_async(text: str, industry: str, deadline: Optional[Deadline] = None) -> list:
+    """Generate content ideas using Claude API."""
+    return await generate_ideas_async("content_ideas", text, industry, "claude", deadline)
+
+def generate_content_ideas_claude(text: str, industry: str, deadline: Optional[Deadline] = None) -> list:
+    """Generate content ideas using Claude API."""
+    return generate_ideas("content_ideas", text, industry, "claude", deadline)
+
+def _joint_generation_enabled() -> bool:
+    """Whether combined clicks ask for every kind in one upstream call (JOINT_GENERATION, default on)."""
+    return os.getenv("JOINT_GENERATION", "1") != "0"
+
+async def _timed_generation(kind: str, text: str, industry: str, model_choice: str, deadline: Optional[Deadline]) -> Tuple[List[str], Dict[str, float]]:
+    """Generate one kind and return its items with the seconds spent per stage."""
+    timings: Dict[str, float] = {}
+    token = _stage_timings.set(timings)
+    started = time.perf_counter()
+    try:
+        items = await generate_ideas_async(kind, text, industry, model_choice, deadline)
+    finally:
+        _stage_timings.reset(token)
+    timings = {name: round(seconds, 4) for name, seconds in timings.items()}
+    timings["total"] = round(time.perf_counter() - started, 4)
+    return items, timings
+
+async def _timed_joint_generation(text: str, industry: str, model_choice: str, deadline: Optional[Deadline]) -> Tuple[Dict[str, List[str]], Dict[str, float]]:
+    """Generate every kind with one upstream call and return the items with the seconds spent per stage."""
+    timings: Dict[str, float] = {}
+    token = _stage_timings.set(timings)
+    started = time.perf_counter()
+    try:
+        reused = {kind: await _reused_result(kind, text, industry, model_choice) for kind in CONTENT_KINDS}
+        if all(items is not None for items in reused.values()):
+            groups = reused
+        else:
+            groups = await _inflight.do(("generate_both", text, industry, model_choice), lambda: _run_click(_generate_joint_async(text, industry, model_choice), deadline, industry))
+    finally:
+        _stage_timings.reset(token)
+    timings = {name: round(seconds, 4) for name, seconds in timings.items()}
+    timings["total"] = round(time.perf_counter() - started, 4)
+    return {kind: list(items) for kind, items in groups.items()}, timings
+
+async def generate_both_async(text: str, industry: str, model_choice: str, deadline: Optional[Deadline] = None, joint: Optional[bool] = None) -> Dict[str, object]:
+    """Generate captions and content ideas as one click.
+
+    By default (JOINT_GENERATION) one upstream call asks for both kinds and
+    all six items are validated in one batch; with joint=False the two
+    pipelines run concurrently instead. Either way the click's upstream calls
+    share one pool of UPSTREAM_SLOTS, one brief budget and the deadline.
+    Returns the items of each kind and the seconds spent per stage (generate /
+    validate / regenerate / total), under "joint" or per kind:
+
+        {"captions": [...], "content_ideas": [...],
+         "timings": {"joint": {...}, "total": 4.2}}
+    """
+    joint = _joint_generation_enabled() if joint is None else joint
+    started = time.perf_counter()
+    kinds = list(CONTENT_KINDS)
+    with span("generate_both", industry=industry, model=model_choice, joint=joint) as current, upstream_slots(), brief_budget(industry):
+        if joint:
+            groups, joint_timings = await _timed_joint_generation(text, industry, model_choice, deadline)
+            result: Dict[str, object] = dict(groups)
+            timings: Dict[str, object] = {"joint": joint_timings}
+        else:
+            outputs = await asyncio.gather(*(_timed_generation(kind, text, industry, model_choice, deadline) for kind in kinds))
+            result = {kind: items for kind, (items, _) in zip(kinds, outputs)}
+            timings = {kind: stage_timings for kind, (_, stage_timings) in zip(kinds, outputs)}
+        timings["total"] = round(time.perf_counter() - started, 4)
+        result["timings"] = timings
+        current.set(seconds=timings["total"])
+    log.info("combined generation finished", industry=industry, provider=model_choice, timings=timings)
+    return result
+
+def generate_both(text: str, industry: str, model_choice: str, deadline: Optional[Deadline] = None, joint: Optional[bool] = None) -> Dict[str, object]:
+    """Generate captions and content ideas as one click (see generate_both_async)."""
+    return _run_sync(generate_both_async(text, industry, model_choice, deadline, joint))
 
 def _parse_single_item(raw_str, keys):
     """Parse a single item from a JSON response."""
@@ -150,60 +900,17 @@ def _parse_single_item(raw_str, keys):
     except Exception:
         return raw_str.strip()
 
-def generate_content_ideas(text: str, industry: str) -> List[str]:
-    """Generate content ideas based on the brief."""
-    print(f"\n=== Generating Content Ideas for {industry} ===")
-    try:
-        response = call_openai_api([
-            {"role": "system", "content": f"You are a creative strategist for a digital agency specializing in {industry}. Based on the following campaign brief, generate exactly three detailed content ideas for social media posts. Each idea MUST be specifically relevant to the {industry} industry. Return ONLY a valid JSON object with a single key: 'content_ideas', whose value is an array of three strings. No commentary, no extra fields, no markdown, no code block."},
-            {"role": "user", "content": text}
-        ], model="gpt-4")
-        
-        arguments_str = response.choices[0].message.content
-        print(f"Raw response: {arguments_str}")
-        content_ideas = _robust_json_parse(arguments_str, ["content_ideas", "contents", "content"], 3)
-        
-        # Validate each content idea and regenerate failed ones
-        final_ideas = []
-        for i, idea in enumerate(content_ideas):
-            if validate_industry_relevance(idea, industry):
-                final_ideas.append(idea)
-            else:
-                print(f"Content idea not relevant to {industry}: {idea}")
-                # Regenerate just this idea
-                try:
-                    response = call_openai_api([
-                        {"role": "system", "content": f"You are a creative strategist for a digital agency specializing in {industry}. Generate ONE detailed content idea for social media posts that is specifically relevant to the {industry} industry. Return ONLY the content idea text, with no additional formatting or structure."},
-                        {"role": "user", "content": text}
-                    ], model="gpt-4")
-                    
-                    new_idea = response.choices[0].message.content.strip()
-                    if validate_industry_relevance(new_idea, industry):
-                        final_ideas.append(new_idea)
-                    else:
-                        print(f"Regenerated content idea still not relevant to {industry}: {new_idea}")
-                        final_ideas.append(f"{new_idea} (low relevance)")
-                except Exception as e:
-                    print(f"Error regenerating content idea: {str(e)}")
-                    final_ideas.append(f"{idea} (low relevance)")
-        
-        print(f"Final content ideas: {final_ideas}")
-        return final_ideas
-    except Exception as e:
-        print(f"Error in generate_content_ideas: {str(e)}")
-        raise e
 
 def generate_brief_and_ideas(text_brief: str, industry: str, demographics: Optional[Dict[str, List[str]]] = None) -> Tuple[str, List[str], List[str]]:
     """Generate summary and ideas from a brief."""
-    print("\n=== Starting Content Generation ===")
-    print(f"Industry: {industry}")
-    print(f"Brief: {text_brief[:100]}...")
-    
+    log.info("starting content generation", industry=industry)
+    log.payload("brief", brief=text_brief)
+
     if not text_brief or not text_brief.strip():
-        print("Error: No brief provided")
+        log.warning("no brief provided")
         return "No brief provided. Please enter a text brief.", [], []
     if not industry or not industry.strip():
-        print("Error: No industry provided")
+        log.warning("no industry provided")
         return "No industry provided. Please select an industry.", [], []
     
     try:
@@ -220,142 +927,126 @@ Demographics (default values used):
 Original Brief:
 {summarized}
 """
-        print("Generating captions...")
-        captions = generate_caption_ideas(demographics_context, industry)
-        print("Generating content ideas...")
-        contents = generate_content_ideas(demographics_context, industry)
-        print("=== Content Generation Complete ===")
-        return summarized, captions, contents
+        # Captions and content ideas are independent, so they run side by side
+        result = generate_both(demographics_context, industry, "gpt-4")
+        log.info("content generation complete", industry=industry, timings=result["timings"])
+        return summarized, result["captions"], result["content_ideas"]
     except Exception as e:
-        print(f"Error in generate_brief_and_ideas: {str(e)}")
+        log.error("generate_brief_and_ideas failed", error=str(e))
         raise e
 
-def generate_caption_ideas_claude(text: str, industry: str) -> list:
-    """Generate caption ideas using Claude API."""
-    api_key = os.getenv("ANTHROPIC_API_KEY")
-    url = "https://api.anthropic.com/v1/messages"
-    headers = {
-        "x-api-key": api_key,
-        "anthropic-version": "2023-06-01",
-        "content-type": "application/json"
-    }
-    
-    try:
-        # First attempt to generate all captions
-        prompt = f"You are a creative strategist for a digital agency specializing in {industry}. Based on the following campaign brief, generate exactly three short, engaging caption ideas for social media posts. Each caption MUST be specifically relevant to the {industry} industry. Return ONLY a valid JSON object with a single key: 'captions', whose value is an array of three strings. No commentary, no extra fields, no markdown, no code block.\n\n{text}"
-        data = {
-            "model": "claude-3-5-sonnet-20241022",
-            "max_tokens": 512,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ]
-        }
-        
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        content = response.json()["content"][0]["text"]
-        print(f"Claude raw response: {content}")
-        captions = _robust_json_parse(content, ["captions", "caption_ideas"], 3)
-        
-        # Validate each caption and regenerate failed ones
-        final_captions = []
-        for i, caption in enumerate(captions):
-            if validate_industry_relevance(caption, industry):
-                final_captions.append(caption)
-            else:
-                print(f"Claude caption not relevant to {industry}: {caption}")
-                # Regenerate just this caption
-                try:
-                    prompt = f"You are a creative strategist for a digital agency specializing in {industry}. Generate ONE short, engaging caption idea for social media posts that is specifically relevant to the {industry} industry. Return ONLY the caption text, with no additional formatting or structure.\n\n{text}"
-                    data = {
-                        "model": "claude-3-5-sonnet-20241022",
-                        "max_tokens": 512,
-                        "messages": [
-                            {"role": "user", "content": prompt}
-                        ]
-                    }
-                    
-                    response = requests.post(url, headers=headers, json=data)
-                    response.raise_for_status()
-                    new_content = response.json()["content"][0]["text"]
-                    new_caption = new_content.strip()
-                    
-                    if validate_industry_relevance(new_caption, industry):
-                        final_captions.append(new_caption)
-                    else:
-                        print(f"Regenerated Claude caption still not relevant to {industry}: {new_caption}")
-                        final_captions.append(f"{new_caption} (low relevance)")
-                except Exception as e:
-                    print(f"Error regenerating Claude caption: {str(e)}")
-                    final_captions.append(f"{caption} (low relevance)")
-        
-        print(f"Claude final captions: {final_captions}")
-        return final_captions
-    except Exception as e:
-        print(f"Claude API error: {str(e)}")
-        return [f"Claude caption idea {i+1}" for i in range(3)]
 
-def generate_content_ideas_claude(text: str, industry: str) -> list:
-    """Generate content ideas using Claude API."""
-    api_key = os.getenv("ANTHROPIC_API_KEY")
-    url = "https://api.anthropic.com/v1/messages"
-    headers = {
-        "x-api-key": api_key,
-        "anthropic-version": "2023-06-01",
-        "content-type": "application/json"
-    }
-    
-    try:
-        # First attempt to generate all content ideas
-        prompt = f"You are a creative strategist for a digital agency specializing in {industry}. Based on the following campaign brief, generate exactly three detailed content ideas for social media posts. Each idea MUST be specifically relevant to the {industry} industry. Return ONLY a valid JSON object with a single key: 'content_ideas', whose value is an array of three strings. No commentary, no extra fields, no markdown, no code block.\n\n{text}"
-        data = {
-            "model": "claude-3-5-sonnet-20241022",
-            "max_tokens": 512,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ]
-        }
-        
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        content = response.json()["content"][0]["text"]
-        print(f"Claude raw response: {content}")
-        content_ideas = _robust_json_parse(content, ["content_ideas", "contents", "content"], 3)
-        
-        # Validate each content idea and regenerate failed ones
-        final_ideas = []
-        for i, idea in enumerate(content_ideas):
-            if validate_industry_relevance(idea, industry):
-                final_ideas.append(idea)
+async def generate_ideas_stream_async(kind: str, text: str, industry: str, model_choice: str, deadline: Optional[Deadline] = None) -> AsyncIterator[List[str]]:
+    """Stream captions or content ideas as they are generated.
+
+    Each yield is the current list of items. An item appears as soon as its JSON
+    string closes; the last yield carries the validated items, with failed ones
+    regenerated or marked "(low relevance)".
+    """
+    spec = CONTENT_KINDS[kind]
+    label = f"{get_provider(model_choice).display_name} {spec['label']}"
+    log.info("streaming", kind=kind, industry=industry, provider=model_choice)
+    reused = await _reused_result(kind, text, industry, model_choice)
+    if reused is not None:
+        yield reused
+        return
+    with span("generate", kind=kind, industry=industry, model=model_choice, stream=True):
+        # Identical concurrent clicks read one upstream stream
+        key = ("generate_stream", kind, text, industry, model_choice)
+        async for items in _inflight.stream(key, lambda: _run_click_stream(_stream_ideas_async(kind, text, industry, model_choice, label), deadline, industry)):
+            yield items
+
+def _record_early_stop(model_choice: str, kind: str, raw: str, parser: ItemStreamParser, seconds: float, generating_seconds: float, latencies: Dict[str, float]) -> None:
+    """Count an early-stopped stream and estimate the output tokens and time it saved.
+
+    The prompt asks for exactly the items that have arrived, so all the answer
+    still owes is one token per open bracket; anything the model might have
+    added beyond that is not counted. The bound max_tokens leaves is kept on the
+    span as tokens_saved_max. generating_seconds is the time from the first
+    delta to the stop, which gives the stream's own output rate.
+    """
+    provider = get_provider(model_choice)
+    received = max(1, len(raw) // 4)
+    saved_max = max(0, provider.max_tokens - received) if provider.max_tokens else parser.depth
+    saved_tokens = min(saved_max, parser.depth)
+    saved_seconds = saved_tokens * generating_seconds / received
+    latencies["early_stop"] = seconds
+    EARLY_STOPS.inc(provider=model_choice)
+    TOKENS_SAVED.inc(saved_tokens, provider=model_choice)
+    SECONDS_SAVED.inc(saved_seconds, provider=model_choice)
+    # The answer was read by the incremental parser rather than _parse_generation
+    PARSE_TIER.inc(tier="stream")
+    PARSE_OUTCOME.inc(provider=model_choice, mode=provider.output_mode(), outcome="ok")
+    current_span().set(early_stop=True, tokens_received=received, tokens_saved=saved_tokens, tokens_saved_max=saved_max, seconds_saved=round(saved_seconds, 3))
+    log.info("stream stopped early", kind=kind, provider=model_choice, tokens_received=received,
+             tokens_saved=saved_tokens, seconds_saved=round(saved_seconds, 3))
+
+async def _stream_ideas_async(kind: str, text: str, industry: str, model_choice: str, label: str) -> AsyncIterator[List[str]]:
+    with usage_scope() as usage:
+        spec = CONTENT_KINDS[kind]
+        count = _candidate_count()
+        started = time.perf_counter()
+        latencies: Dict[str, float] = {}
+        parser = ItemStreamParser(spec["keys"])
+        deltas: List[str] = []
+        items: List[str] = []
+        candidates: List[str] = []
+        stopped_early = False
+        first_delta: Optional[float] = None
+        try:
+            open_stream = _hedged_stream_async if hedging_enabled() else _stream_async
+            stream = open_stream(model_choice, generation_prompt(kind, industry, count), text, output_schema((kind,)))
+            try:
+                async for delta in stream:
+                    if first_delta is None:
+                        first_delta = time.perf_counter()
+                    deltas.append(delta)
+                    if not parser.feed(delta):
+                        continue
+                    parsed = parser.items()[:3]
+                    if len(parsed) > len(items):
+                        if not items:
+                            latencies["first_item"] = time.perf_counter() - started
+                            log.info("first streamed item", kind=kind, provider=model_choice, seconds=round(latencies["first_item"], 3))
+                        items = parsed
+                        yield list(items)
+                    if _early_stop_enabled() and len(parser.items()) >= count and not parser.done:
+                        # Every item asked for has arrived; the rest is closing brackets or chatter
+                        stopped_early = True
+                        break
+            finally:
+                await stream.aclose()
+            raw = "".join(deltas)
+            log.payload("raw streamed response", provider=model_choice, kind=kind, text=raw)
+            if stopped_early:
+                candidates = parser.items()[:count]
+                stopped = time.perf_counter()
+                _record_early_stop(model_choice, kind, raw, parser, stopped - started, stopped - (first_delta or started), latencies)
             else:
-                print(f"Claude content idea not relevant to {industry}: {idea}")
-                # Regenerate just this idea
-                try:
-                    prompt = f"You are a creative strategist for a digital agency specializing in {industry}. Generate ONE detailed content idea for social media posts that is specifically relevant to the {industry} industry. Return ONLY the content idea text, with no additional formatting or structure.\n\n{text}"
-                    data = {
-                        "model": "claude-3-5-sonnet-20241022",
-                        "max_tokens": 512,
-                        "messages": [
-                            {"role": "user", "content": prompt}
-                        ]
-                    }
-                    
-                    response = requests.post(url, headers=headers, json=data)
-                    response.raise_for_status()
-                    new_content = response.json()["content"][0]["text"]
-                    new_idea = new_content.strip()
-                    
-                    if validate_industry_relevance(new_idea, industry):
-                        final_ideas.append(new_idea)
-                    else:
-                        print(f"Regenerated Claude content idea still not relevant to {industry}: {new_idea}")
-                        final_ideas.append(f"{new_idea} (low relevance)")
-                except Exception as e:
-                    print(f"Error regenerating Claude content idea: {str(e)}")
-                    final_ideas.append(f"{idea} (low relevance)")
-        
-        print(f"Claude final content ideas: {final_ideas}")
-        return final_ideas
-    except Exception as e:
-        print(f"Claude API error: {str(e)}")
-        return [f"Claude content idea {i+1}" for i in range(3)]
\ No newline at end of file
+                # Over-generated candidates beyond the first three are kept for selection
+                candidates = _parse_generation(raw, model_choice, {kind: spec["keys"]}, count, 3)[kind]
+                if candidates[:3] != items:
+                    yield list(candidates[:3])
+        except Exception as e:
+            provider = get_provider(model_choice)
+            if not provider.placeholder_on_error:
+                log.error("streaming failed", kind=kind, provider=model_choice, error=str(e))
+                raise e
+            log.error("streaming failed, returning placeholders", kind=kind, provider=model_choice, error=str(e))
+            yield _placeholders(model_choice, kind)
+            return
+
+        async def regenerate() -> str:
+            return await _regenerate_async(model_choice, kind, industry, text)
+
+        final_items, verdicts = await _validate_and_regenerate(candidates, industry, regenerate, label)
+        latencies["total"] = time.perf_counter() - started
+        log.info("streamed generation finished", kind=kind, industry=industry, provider=model_choice,
+                 seconds=round(latencies["total"], 3))
+        log.payload("final items", kind=kind, items=final_items)
+        _store_result(kind, text, industry, model_choice, final_items, verdicts, latencies, stream=True, usage=usage)
+        yield final_items
+
+def generate_ideas_stream(kind: str, text: str, industry: str, model_choice: str, deadline: Optional[Deadline] = None) -> Iterator[List[str]]:
+    """Synchronous generator over generate_ideas_stream_async, for Gradio handlers."""
+    return _iterate_sync(generate_ideas_stream_async(kind, text, industry, model_choice, deadline))
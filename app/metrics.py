@@ -0,0 +1,215 @@
+"""In-process metrics with a Prometheus text exposition.
+
+Counters and histograms are created once at module level and recorded on the
+hot path:
+
+    UPSTREAM_SECONDS = histogram("llm_upstream_call_seconds", "Upstream call latency", ["provider", "model", "outcome"])
+    UPSTREAM_SECONDS.observe(0.82, provider="openai", model="gpt-4", outcome="ok")
+
+Each thread records into its own shard, so recording takes no lock: the only
+writer of a shard is the thread that owns it. render() sums the shards when
+/metrics is scraped.
+
+Components that already keep their own counts (caches, hedging, rate limiters,
+single-flight) export them through a callback read at scrape time instead:
+
+    counter_func("llm_cache_lookups_total", "Cache lookups", ["cache", "result"],
+                 lambda: {("response", "hit"): response_cache.hits, ...})
+"""
+import bisect
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _shard_items(self) -> List[Tuple[LabelValues, object]]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        items = []
+        for shard in shards:
+            while True:
+                try:
+                    # Copy first, so a failed read adds nothing
+                    copied = list(shard.items())
+                except RuntimeError:
+                    # The owning thread added a label set mid-copy; read again
+                    continue
+                items.extend(copied)
+                break
+        return items
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def values(self) -> Dict[LabelValues, float]:
+        totals: Dict[LabelValues, float] = {}
+        for key, value in self._shard_items():
+            totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}"
+                for key, value in sorted(self.values().items())]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        shard = self._shard()
+        key = self._key(labels)
+        state = shard.get(key)
+        if state is None:
+            # [per-bucket counts (last one is +Inf), sum, count]
+            state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            shard[key] = state
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def values(self) -> Dict[LabelValues, Tuple[List[int], float, int]]:
+        totals: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+        for key, (counts, total, count) in self._shard_items():
+            merged = totals.get(key)
+            if merged is None:
+                totals[key] = (list(counts), total, count)
+            else:
+                totals[key] = ([a + b for a, b in zip(merged[0], counts)], merged[1] + total, merged[2] + count)
+        return totals
+
+    def render(self) -> List[str]:
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, (counts, total, count) in sorted(self.values().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(list(self.buckets) + [float("inf")], counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _format_number(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_number(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+class Collected(_Metric):
+    """A counter or gauge whose values are read from a callback when /metrics is scraped."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], kind: str, values: Callable[[], Dict[LabelValues, float]]):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.values = values
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}"
+                for key, value in sorted(self.values().items())]
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, *args, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets)
+
+    def collected(self, name: str, help: str, labelnames: Sequence[str], kind: str, values: Callable[[], Dict[LabelValues, float]]) -> Collected:
+        # Re-registering replaces the callback, e.g. after a module reload
+        metric = Collected(name, help, labelnames, kind, values)
+        with self._lock:
+            existing = self._metrics.get(name)
+            if existing is not None and not isinstance(existing, Collected):
+                raise ValueError(f"Metric {name} is already registered as a {existing.kind}")
+            self._metrics[name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        with self._lock:
+            return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.counter(name, help, labelnames)
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.histogram(name, help, labelnames, buckets)
+
+def counter_func(name: str, help: str, labelnames: Sequence[str], values: Callable[[], Dict[LabelValues, float]]) -> Collected:
+    """Export a count a component already keeps; values() maps label values to the running total."""
+    return REGISTRY.collected(name, help, labelnames, "counter", values)
+
+def gauge_func(name: str, help: str, labelnames: Sequence[str], values: Callable[[], Dict[LabelValues, float]]) -> Collected:
+    """Export a current level (entries, queue length) read when /metrics is scraped."""
+    return REGISTRY.collected(name, help, labelnames, "gauge", values)
+
+def render_metrics() -> str:
+    return REGISTRY.render()
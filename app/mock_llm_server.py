@@ -0,0 +1,334 @@
+"""Local stand-in for the OpenAI and Anthropic APIs.
+
+Speaks the OpenAI chat-completions (POST /v1/chat/completions) and Anthropic
+messages (POST /v1/messages) wire formats, streaming included, so the service
+can be exercised and benchmarked without spending API credits. Point the
+service at it with:
+
+    python mock_llm_server.py --port 8900 --latency lognormal:0.8:0.5 --error-429 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 ANTHROPIC_BASE_URL=http://127.0.0.1:8900 python app.py
+
+Replies are derived from the prompt:
+    generation prompts      a JSON object with the requested number of items under
+                            each requested key; with response_format (OpenAI) or a
+                            forced tool (Anthropic) the object is the message content
+                            or the tool_use input
+    regeneration prompts    one plain-text item
+    relevance prompts       canned verdicts: an item is irrelevant when the crc32
+                            of (industry, text) falls in the --irrelevant-rate share
+
+Latency distributions (--latency), in seconds per request:
+    fixed:SECONDS   uniform:LOW:HIGH   lognormal:MEDIAN:SIGMA
+
+Faults are drawn per request: --error-429 (with Retry-After), --error-5xx
+(503 for OpenAI, 529 for Anthropic) and --malformed (the reply text is cut off
+mid-JSON; structured replies are never malformed, as with constrained decoding). All randomness comes from --seed, so a run is reproducible for a
+given request order.
+
+GET /stats returns request, fault and token counts; POST /reset clears them.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+class LatencyModel:
+    """Per-request latency drawn from a fixed, uniform or lognormal distribution."""
+
+    def __init__(self, spec: str):
+        kind, *params = spec.split(":")
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2}
+        if kind not in expected or len(params) != expected[kind]:
+            raise ValueError(f"Invalid latency spec {spec!r}; use fixed:S, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA")
+        self.spec = spec
+        self.kind = kind
+        self.params = [float(param) for param in params]
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(self.params[0], self.params[1])
+        median, sigma = self.params
+        return median * math.exp(rng.gauss(0.0, sigma))
+
+class MockConfig:
+    def __init__(self, latency: str = "fixed:0.05", error_429: float = 0.0, error_5xx: float = 0.0,
+                 malformed: float = 0.0, irrelevant_rate: float = 0.2, ttft_fraction: float = 0.3, seed: int = 0):
+        self.latency = LatencyModel(latency)
+        self.error_429 = error_429
+        self.error_5xx = error_5xx
+        self.malformed = malformed
+        self.irrelevant_rate = irrelevant_rate
+        self.ttft_fraction = ttft_fraction
+        self.seed = seed
+
+class MockState:
+    """Seeded randomness and counters shared by all request threads."""
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self._rng = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self._ids = 0
+        self.counts: Dict[str, int] = {}
+
+    def draw(self) -> Tuple[int, float, Optional[str]]:
+        """Request id, latency and injected fault (None, "429", "5xx" or "malformed")."""
+        config = self.config
+        with self._lock:
+            self._ids += 1
+            latency = config.latency.sample(self._rng)
+            roll = self._rng.random()
+        fault = None
+        if roll < config.error_429:
+            fault = "429"
+        elif roll < config.error_429 + config.error_5xx:
+            fault = "5xx"
+        elif roll < config.error_429 + config.error_5xx + config.malformed:
+            fault = "malformed"
+        return self._ids, latency, fault
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counts = {}
+
+_KEYS_RE = re.compile(r"keys?: ('\w+'(?: and '\w+')*)")
+_COUNT_RE = re.compile(r"exactly (\w+)")
+_INDUSTRY_RE = re.compile(r"(?:specializing in|relevant to the) ([^.]+?)(?: industry|\.)")
+_NUMBERED_RE = re.compile(r"^(\d+)\. (\".*\")$", re.MULTILINE)
+
+def is_relevant(text: str, industry: str, irrelevant_rate: float) -> bool:
+    return zlib.crc32(f"{industry}|{text}".encode("utf-8")) % 1000 >= irrelevant_rate * 1000
+
+def reply_text(prompt: str, irrelevant_rate: float) -> str:
+    """The model output for a prompt (system and user text joined by a blank line)."""
+    system, _, user = prompt.partition("\n\n")
+    industry = _INDUSTRY_RE.search(system)
+    industry = industry.group(1) if industry else "general"
+    if "'verdicts'" in system:
+        items = [json.loads(text) for _, text in _NUMBERED_RE.findall(user)]
+        return json.dumps({"verdicts": [
+            {"index": i + 1, "is_relevant": is_relevant(text, industry, irrelevant_rate)} for i, text in enumerate(items)
+        ]})
+    if "'is_relevant'" in system:
+        return json.dumps({"is_relevant": is_relevant(user, industry, irrelevant_rate)})
+    brief = " ".join(user.split()[:8])
+    variant = zlib.crc32(user.encode("utf-8")) % 1000
+    keys = _KEYS_RE.search(system)
+    if not keys:
+        return f"{industry} idea #{variant} for {brief}"
+    count = _COUNT_RE.search(system)
+    count = int(count.group(1)) if count and count.group(1).isdigit() else 3
+    return json.dumps({key: [f"{industry} idea #{variant + 100 * k + i} for {brief}" for i in range(count)]
+                       for k, key in enumerate(re.findall(r"'(\w+)'", keys.group(1)))})
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def _chunks(text: str, size: int = 16) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: MockState
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_events(self, events: Iterator[str], delay: float) -> None:
+        """Send server-sent events with chunked encoding, spreading `delay` across them."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for event in events:
+            data = event.encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+            time.sleep(delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._send_json(200, self.state.stats())
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        path = self.path.rstrip("/")
+        if path == "/reset":
+            self.state.reset()
+            self._send_json(200, {})
+        elif path.endswith("/chat/completions"):
+            self._handle("openai", request)
+        elif path.endswith("/messages"):
+            self._handle("anthropic", request)
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def _handle(self, provider: str, request: dict) -> None:
+        state = self.state
+        request_id, latency, fault = state.draw()
+        state.count(f"{provider}_requests")
+        stream = bool(request.get("stream"))
+        if fault in ("429", "5xx"):
+            time.sleep(latency * state.config.ttft_fraction)
+            state.count(f"{provider}_{fault}")
+            status = 429 if fault == "429" else (503 if provider == "openai" else 529)
+            error_type = "rate_limit_error" if fault == "429" else "overloaded_error"
+            message = f"Injected {status} from mock server"
+            body = {"error": {"message": message, "type": error_type}}
+            if provider == "anthropic":
+                body = {"type": "error", "error": {"type": error_type, "message": message}}
+            self._send_json(status, body, {"retry-after": "1"} if fault == "429" else None)
+            return
+
+        messages = request.get("messages") or []
+        prompt = "\n\n".join(str(message.get("content", "")) for message in messages)
+        text = reply_text(prompt, state.config.irrelevant_rate)
+        tool = (request.get("tools") or [{}])[0].get("name") if request.get("tool_choice") else None
+        structured = bool(request.get("response_format") or tool)
+        if structured:
+            state.count(f"{provider}_structured")
+        if fault == "malformed" and not structured:
+            state.count(f"{provider}_malformed")
+            text = text[:max(1, len(text) // 2)]
+        prompt_tokens, completion_tokens = _tokens(prompt), _tokens(text)
+        state.count(f"{provider}_tokens", prompt_tokens + completion_tokens)
+        model = request.get("model", "mock")
+
+        if not stream:
+            time.sleep(latency)
+            if provider == "openai":
+                self._send_json(200, _openai_completion(request_id, model, text, prompt_tokens, completion_tokens))
+            else:
+                self._send_json(200, _anthropic_message(request_id, model, text, prompt_tokens, completion_tokens, tool))
+            return
+
+        time.sleep(latency * state.config.ttft_fraction)
+        chunks = _chunks(text)
+        delay = latency * (1 - state.config.ttft_fraction) / len(chunks)
+        include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+        if provider == "openai":
+            events = _openai_events(request_id, model, chunks, prompt_tokens, completion_tokens, include_usage)
+        else:
+            events = _anthropic_events(request_id, model, chunks, prompt_tokens, completion_tokens, tool)
+        self._send_events(events, delay)
+
+def _openai_completion(request_id: int, model: str, text: str, prompt_tokens: int, completion_tokens: int) -> dict:
+    return {
+        "id": f"chatcmpl-mock-{request_id}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+def _openai_events(request_id: int, model: str, chunks: List[str], prompt_tokens: int, completion_tokens: int, include_usage: bool) -> Iterator[str]:
+    base = {"id": f"chatcmpl-mock-{request_id}", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+    for i, chunk in enumerate(chunks):
+        delta = {"role": "assistant", "content": chunk} if i == 0 else {"content": chunk}
+        yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})}\n\n"
+    yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+    if include_usage:
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        yield f"data: {json.dumps({**base, 'choices': [], 'usage': usage})}\n\n"
+    yield "data: [DONE]\n\n"
+
+def _anthropic_message(request_id: int, model: str, text: str, prompt_tokens: int, completion_tokens: int, tool: Optional[str] = None) -> dict:
+    content = {"type": "text", "text": text}
+    if tool:
+        content = {"type": "tool_use", "id": f"toolu_mock_{request_id}", "name": tool, "input": json.loads(text)}
+    return {
+        "id": f"msg_mock_{request_id}",
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": [content],
+        "stop_reason": "tool_use" if tool else "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": prompt_tokens, "output_tokens": completion_tokens},
+    }
+
+def _anthropic_events(request_id: int, model: str, chunks: List[str], prompt_tokens: int, completion_tokens: int, tool: Optional[str] = None) -> Iterator[str]:
+    def event(name: str, data: dict) -> str:
+        return f"event: {name}\ndata: {json.dumps({'type': name, **data})}\n\n"
+
+    message = _anthropic_message(request_id, model, "", prompt_tokens, 1)
+    message.update(content=[], stop_reason=None)
+    yield event("message_start", {"message": message})
+    if tool:
+        block = {"type": "tool_use", "id": f"toolu_mock_{request_id}", "name": tool, "input": {}}
+        deltas = [{"type": "input_json_delta", "partial_json": chunk} for chunk in chunks]
+    else:
+        block = {"type": "text", "text": ""}
+        deltas = [{"type": "text_delta", "text": chunk} for chunk in chunks]
+    yield event("content_block_start", {"index": 0, "content_block": block})
+    for delta in deltas:
+        yield event("content_block_delta", {"index": 0, "delta": delta})
+    yield event("content_block_stop", {"index": 0})
+    yield event("message_delta", {"delta": {"stop_reason": "tool_use" if tool else "end_turn", "stop_sequence": None}, "usage": {"output_tokens": completion_tokens}})
+    yield event("message_stop", {})
+
+def serve(config: MockConfig, host: str = "127.0.0.1", port: int = 0, background: bool = False) -> ThreadingHTTPServer:
+    """Start the mock server; port 0 picks a free port (see server.server_address)."""
+    handler = type("BoundMockHandler", (MockHandler,), {"state": MockState(config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    if background:
+        threading.Thread(target=server.serve_forever, name="mock-llm-server", daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", default="fixed:0.05", help="per-request latency distribution (default fixed:0.05)")
+    parser.add_argument("--error-429", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--error-5xx", type=float, default=0.0, help="share of requests answered with 503/529")
+    parser.add_argument("--malformed", type=float, default=0.0, help="share of replies cut off mid-JSON")
+    parser.add_argument("--irrelevant-rate", type=float, default=0.2, help="share of items judged irrelevant")
+    parser.add_argument("--ttft-fraction", type=float, default=0.3, help="share of a streamed reply's latency before the first delta")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    return MockConfig(args.latency, args.error_429, args.error_5xx, args.malformed, args.irrelevant_rate, args.ttft_fraction, args.seed)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    print(f"Mock LLM server on http://{args.host}:{args.port} (latency {args.latency})")
+    serve(config_from_args(args), args.host, args.port)
+
+if __name__ == "__main__":
+    main()
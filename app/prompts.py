@@ -0,0 +1,71 @@
+"""Prompt templates for generated captions and content ideas.
+
+Every provider gets the same wording. Prompts are rendered once per (kind,
+industry, count) and reused, since the 14 industries and two kinds make for
+a small, fixed set.
+"""
+import functools
+from typing import Any, Dict, Tuple
+
+# Wording and JSON keys for each kind of generated item
+CONTENT_KINDS = {
+    "captions": {
+        "label": "caption",
+        "title": "Captions",
+        "items": "short, engaging caption ideas",
+        "item": "short, engaging caption idea",
+        "each": "Each caption",
+        "text": "the caption text",
+        "keys": ["captions", "caption_ideas"],
+        "fallback": "caption idea",
+    },
+    "content_ideas": {
+        "label": "content idea",
+        "title": "Content Ideas",
+        "items": "detailed content ideas",
+        "item": "detailed content idea",
+        "each": "Each idea",
+        "text": "the content idea text",
+        "keys": ["content_ideas", "contents", "content"],
+        "fallback": "content idea",
+    },
+}
+
+@functools.lru_cache(maxsize=None)
+def generation_prompt(kind: str, industry: str, count: int = 3) -> str:
+    """System prompt asking for `count` items of `kind` as a JSON object."""
+    spec = CONTENT_KINDS[kind]
+    number = "three" if count == 3 else str(count)
+    return f"You are a creative strategist for a digital agency specializing in {industry}. Based on the following campaign brief, generate exactly {number} {spec['items']} for social media posts. {spec['each']} MUST be specifically relevant to the {industry} industry. Return ONLY a valid JSON object with a single key: '{kind}', whose value is an array of {number} strings. No commentary, no extra fields, no markdown, no code block."
+
+@functools.lru_cache(maxsize=None)
+def joint_generation_prompt(industry: str, count: int = 3) -> str:
+    """System prompt asking for `count` items of every kind in one JSON object."""
+    number = "three" if count == 3 else str(count)
+    kinds = list(CONTENT_KINDS)
+    wanted = " and ".join(f"exactly {number} {CONTENT_KINDS[kind]['items']}" for kind in kinds)
+    keys = " and ".join(f"'{kind}'" for kind in kinds)
+    return f"You are a creative strategist for a digital agency specializing in {industry}. Based on the following campaign brief, generate {wanted} for social media posts. Every caption and idea MUST be specifically relevant to the {industry} industry. Return ONLY a valid JSON object with {len(kinds)} keys: {keys}, each of whose value is an array of {number} strings. No commentary, no extra fields, no markdown, no code block."
+
+@functools.lru_cache(maxsize=None)
+def output_schema(kinds: Tuple[str, ...]) -> Dict[str, Any]:
+    """JSON schema of a generation answer: one array of strings per kind.
+
+    Item counts are left to the prompt, since strict OpenAI schemas reject
+    minItems/maxItems; the decoder checks them.
+    """
+    return {
+        "type": "object",
+        "properties": {
+            kind: {"type": "array", "items": {"type": "string"}, "description": f"The {CONTENT_KINDS[kind]['items']}"}
+            for kind in kinds
+        },
+        "required": list(kinds),
+        "additionalProperties": False,
+    }
+
+@functools.lru_cache(maxsize=None)
+def regeneration_prompt(kind: str, industry: str) -> str:
+    """System prompt asking for one replacement item as plain text."""
+    spec = CONTENT_KINDS[kind]
+    return f"You are a creative strategist for a digital agency specializing in {industry}. Generate ONE {spec['item']} for social media posts that is specifically relevant to the {industry} industry. Return ONLY {spec['text']}, with no additional formatting or structure."
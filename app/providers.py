@@ -0,0 +1,475 @@
+"""Upstream LLM providers.
+
+Each provider turns a (system prompt, brief) pair into a completion, either in
+one piece or as a stream of text deltas. The generation pipeline in
+manual_vertical_service.py only talks to this interface, so caching, rate
+limiting, retries and timeouts live in one place per wire format, and adding
+a provider means implementing two methods and registering it.
+
+Providers:
+    gpt-4   OpenAI chat completions
+    claude  Anthropic messages API
+    mock    deterministic offline stand-in, no network calls
+
+Generation calls pass the JSON schema of the answer. Where the model supports
+it the answer is held to the schema natively: OpenAI through response_format
+(json_schema, or json_object on older snapshots) and Claude through a forced
+tool call whose input is the answer. Models without either (plain gpt-4) get
+the schema only as prompt instructions; output_mode() says which applies.
+
+Configuration (environment variables):
+    OPENAI_BASE_URL        OpenAI-compatible endpoint (read by the OpenAI SDK)
+    OPENAI_MODEL           model behind the "gpt-4" provider (default gpt-4)
+    STRUCTURED_OUTPUT      "0" turns native structured output off for every provider
+    OPENAI_RESPONSE_FORMAT "json_schema", "json_object" or "prompt" to override the
+                           per-model capability check (default auto), e.g. for
+                           OpenAI-compatible endpoints
+    ANTHROPIC_BASE_URL     Anthropic-compatible endpoint (default https://api.anthropic.com)
+    MOCK_PROVIDER_LATENCY  seconds the mock provider waits per call (default 0)
+"""
+import asyncio
+import contextlib
+import json
+import os
+import re
+import time
+import zlib
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+from openai.types.chat import ChatCompletion
+from cache import cache_enabled, make_key, response_cache
+from clients import async_anthropic_session, async_openai_client, openai_client
+from costs import record_usage
+from deadline import call_timeout
+from env import env_float
+from logs import get_logger
+from metrics import counter, histogram
+from rate_limit import estimate_tokens, get_limiter, rate_limit_enabled
+from retry import retry_async, retry_sync
+from tracing import span, start_span
+
+log = get_logger("providers")
+
+UPSTREAM_SECONDS = histogram("llm_upstream_call_seconds", "Upstream LLM call latency, including retries and rate-limit waits", ["provider", "model", "mode", "outcome"])
+UPSTREAM_TOKENS = counter("llm_tokens_total", "Tokens reported by upstream LLM responses", ["provider", "model", "type"])
+
+@contextlib.contextmanager
+def _upstream_call(provider: str, model: str, mode: str) -> Iterator:
+    """Time one upstream call (retries included) and trace it as an "upstream" span.
+
+    Stream spans are not made current, since the generator is suspended at
+    every yield and the caller's spans would otherwise nest under it.
+    """
+    started = time.perf_counter()
+    # Streams closed early (hedge losers, cancelled clicks) keep this outcome
+    outcome = "cancelled"
+    with contextlib.ExitStack() as stack:
+        if mode == "stream":
+            call = start_span("upstream", provider=provider, model=model, mode=mode)
+            stack.callback(call.end)
+        else:
+            call = stack.enter_context(span("upstream", provider=provider, model=model, mode=mode))
+        try:
+            yield call
+            outcome = "ok"
+        except Exception as e:
+            outcome = "error"
+            call.fail(e)
+            raise
+        finally:
+            call.set(outcome=outcome)
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started, provider=provider, model=model, mode=mode, outcome=outcome)
+
+def _record_tokens(call, provider: str, model: str, prompt: Optional[int], completion: Optional[int]) -> None:
+    if not prompt and not completion:
+        return
+    cost = record_usage(provider, model, prompt, completion)
+    call.set(prompt_tokens=prompt, completion_tokens=completion, cost=round(cost, 6))
+    if prompt:
+        UPSTREAM_TOKENS.inc(prompt, provider=provider, model=model, type="prompt")
+    if completion:
+        UPSTREAM_TOKENS.inc(completion, provider=provider, model=model, type="completion")
+
+ANTHROPIC_URL = os.getenv("ANTHROPIC_BASE_URL", "https://api.anthropic.com").rstrip("/") + "/v1/messages"
+CLAUDE_MODEL = "claude-3-5-sonnet-20241022"
+# Sampling parameters shared by every upstream call (also part of the cache key)
+OPENAI_SAMPLING = {"temperature": 0.7, "max_tokens": 512}
+CLAUDE_SAMPLING = {"max_tokens": 512}
+
+# OpenAI models that accept response_format {"type": "json_schema"}. The older
+# snapshots in JSON_OBJECT_MODELS only accept {"type": "json_object"}; anything
+# else (plain gpt-4) gets no response_format at all.
+JSON_SCHEMA_MODELS = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")
+JSON_OBJECT_MODELS = ("gpt-4o-2024-05-13", "gpt-4-turbo", "gpt-4-1106", "gpt-4-0125", "gpt-3.5-turbo")
+# Tool Claude is made to call; its input is the structured answer
+STRUCTURED_TOOL = "return_items"
+
+def structured_output_enabled() -> bool:
+    return os.getenv("STRUCTURED_OUTPUT", "1") != "0"
+
+def openai_output_mode(model: str) -> str:
+    """How `model` can be held to a schema: "json_schema", "json_object" or "prompt" (instructions only)."""
+    if not structured_output_enabled():
+        return "prompt"
+    override = os.getenv("OPENAI_RESPONSE_FORMAT", "auto").lower()
+    if override in ("json_schema", "json_object", "prompt"):
+        return override
+    if model.startswith(JSON_OBJECT_MODELS):
+        return "json_object"
+    if model.startswith(JSON_SCHEMA_MODELS):
+        return "json_schema"
+    return "prompt"
+
+def openai_response_format(model: str, schema: Optional[dict]) -> Optional[dict]:
+    """The response_format holding `model` to `schema`, or None when it cannot be."""
+    mode = openai_output_mode(model) if schema else "prompt"
+    if mode == "json_schema":
+        return {"type": "json_schema", "json_schema": {"name": "generated_items", "strict": True, "schema": schema}}
+    if mode == "json_object":
+        return {"type": "json_object"}
+    return None
+
+def claude_tool(schema: Optional[dict]) -> Optional[dict]:
+    """The tool whose forced call makes Claude answer with `schema`, or None."""
+    if not schema or not structured_output_enabled():
+        return None
+    return {"name": STRUCTURED_TOOL, "description": "Return the generated items.", "input_schema": schema}
+
+def _claude_tool_params(tool: Optional[dict]) -> Dict[str, object]:
+    return {"tools": [tool], "tool_choice": {"type": "tool", "name": tool["name"]}} if tool else {}
+
+def _claude_output(body: Dict) -> str:
+    """The reply text, or the input of a forced tool call serialized as JSON."""
+    for block in body.get("content", []):
+        if block.get("type") == "tool_use":
+            return json.dumps(block.get("input", {}))
+    return body["content"][0]["text"]
+
+
+# Helper: Call OpenAI API (simple version for Hugging Face)
+def call_openai_api(messages, model="gpt-4"):
+    log.payload("OpenAI API call", provider="openai", model=model, messages=messages)
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        log.error("OPENAI_API_KEY environment variable not set")
+        raise ValueError("OPENAI_API_KEY environment variable not set.")
+
+    cache_key = make_key("openai", model, messages, **OPENAI_SAMPLING)
+    if cache_enabled():
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            log.debug("cache hit, skipping API call", provider="openai", model=model)
+            return ChatCompletion.model_validate(cached)
+
+    limiter = get_limiter("openai", model) if rate_limit_enabled() else None
+    estimated = estimate_tokens(messages, OPENAI_SAMPLING["max_tokens"])
+
+    def attempt():
+        if limiter:
+            limiter.acquire(estimated)
+        with openai_client() as client:
+            return client.chat.completions.create(
+                model=model,
+                messages=messages,
+                timeout=call_timeout(),
+                **OPENAI_SAMPLING
+            )
+
+    with _upstream_call("openai", model, "complete") as call:
+        try:
+            response = retry_sync(attempt, "OpenAI API call")
+        except Exception as e:
+            log.warning("API call failed", provider="openai", model=model, error=str(e))
+            raise e
+        if response.usage:
+            _record_tokens(call, "openai", model, response.usage.prompt_tokens, response.usage.completion_tokens)
+    log.debug("API call finished", provider="openai", model=model,
+              tokens=response.usage.total_tokens if response.usage else None)
+    if limiter:
+        limiter.reconcile(estimated, response.usage.total_tokens if response.usage else None)
+    if cache_enabled():
+        response_cache.set(cache_key, response.model_dump())
+    return response
+
+async def call_openai_api_async(messages, model="gpt-4", response_format: Optional[dict] = None):
+    """Async counterpart of call_openai_api; response_format is passed through when given."""
+    log.payload("OpenAI API call", provider="openai", model=model, messages=messages)
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        log.error("OPENAI_API_KEY environment variable not set")
+        raise ValueError("OPENAI_API_KEY environment variable not set.")
+
+    output = {"response_format": response_format} if response_format else {}
+
+    cache_key = make_key("openai", model, messages, **OPENAI_SAMPLING, **output)
+    if cache_enabled():
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            log.debug("cache hit, skipping API call", provider="openai", model=model)
+            return ChatCompletion.model_validate(cached)
+
+    limiter = get_limiter("openai", model) if rate_limit_enabled() else None
+    estimated = estimate_tokens(messages, OPENAI_SAMPLING["max_tokens"])
+
+    async def send():
+        if limiter:
+            await limiter.acquire_async(estimated)
+        with async_openai_client() as client:
+            return await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                **OPENAI_SAMPLING,
+                **output
+            )
+
+    with _upstream_call("openai", model, "complete") as call:
+        try:
+            # Each attempt, including any rate-limit wait, gets the remaining deadline as its timeout
+            response = await retry_async(lambda: asyncio.wait_for(send(), call_timeout()), "OpenAI API call")
+        except Exception as e:
+            log.warning("API call failed", provider="openai", model=model, error=str(e))
+            raise e
+        if response.usage:
+            _record_tokens(call, "openai", model, response.usage.prompt_tokens, response.usage.completion_tokens)
+    log.debug("API call finished", provider="openai", model=model,
+              tokens=response.usage.total_tokens if response.usage else None)
+    if limiter:
+        limiter.reconcile(estimated, response.usage.total_tokens if response.usage else None)
+    if cache_enabled():
+        response_cache.set(cache_key, response.model_dump())
+    return response
+
+def _claude_usage_tokens(usage: Optional[Dict[str, int]]) -> Optional[int]:
+    if not usage:
+        return None
+    return usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+
+async def call_claude_api_async(prompt: str, model: str = CLAUDE_MODEL, tool: Optional[dict] = None) -> str:
+    """Send a single-turn prompt to the Claude messages API and return the text.
+
+    With a tool, Claude is made to call it and the call's input is returned as JSON.
+    """
+    messages = [{"role": "user", "content": prompt}]
+    cache_key = make_key("anthropic", model, messages, **CLAUDE_SAMPLING, **_claude_tool_params(tool))
+    body = response_cache.get(cache_key) if cache_enabled() else None
+    if body is None:
+        limiter = get_limiter("anthropic", model) if rate_limit_enabled() else None
+        estimated = estimate_tokens(messages, CLAUDE_SAMPLING["max_tokens"])
+        data = {"model": model, "messages": messages, **CLAUDE_SAMPLING, **_claude_tool_params(tool)}
+
+        async def send():
+            if limiter:
+                await limiter.acquire_async(estimated)
+            with async_anthropic_session() as session:
+                response = await session.post(ANTHROPIC_URL, json=data, timeout=call_timeout())
+            response.raise_for_status()
+            return response
+
+        with _upstream_call("anthropic", model, "complete") as call:
+            response = await retry_async(lambda: asyncio.wait_for(send(), call_timeout()), "Claude API call")
+            body = response.json()
+            usage = body.get("usage") or {}
+            _record_tokens(call, "anthropic", model, usage.get("input_tokens"), usage.get("output_tokens"))
+        if limiter:
+            limiter.reconcile(estimated, _claude_usage_tokens(body.get("usage")))
+        if cache_enabled():
+            response_cache.set(cache_key, body)
+    return _claude_output(body)
+
+
+async def stream_openai_api_async(messages, model="gpt-4", response_format: Optional[dict] = None) -> AsyncIterator[str]:
+    """Stream a chat completion from OpenAI, yielding text deltas as they arrive."""
+    limiter = get_limiter("openai", model) if rate_limit_enabled() else None
+    estimated = estimate_tokens(messages, OPENAI_SAMPLING["max_tokens"])
+    with _upstream_call("openai", model, "stream") as call, async_openai_client() as client:
+        if limiter:
+            await limiter.acquire_async(estimated)
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **OPENAI_SAMPLING,
+            **({"response_format": response_format} if response_format else {})
+        )
+        received = 0
+        usage_seen = False
+        try:
+            async for chunk in stream:
+                if chunk.usage:
+                    usage_seen = True
+                    _record_tokens(call, "openai", model, chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+                    if limiter:
+                        limiter.reconcile(estimated, chunk.usage.total_tokens)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    received += len(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        finally:
+            if not usage_seen:
+                # Closed before the usage chunk (stopped early or cut off): charge an estimate
+                prompt_tokens = estimate_tokens(messages, 0)
+                _record_tokens(call, "openai", model, prompt_tokens, received // 4)
+                call.set(usage="estimated")
+                if limiter:
+                    limiter.reconcile(estimated, prompt_tokens + received // 4)
+            await stream.close()
+
+async def stream_claude_api_async(prompt: str, model: str = CLAUDE_MODEL, tool: Optional[dict] = None) -> AsyncIterator[str]:
+    """Stream a Claude message over server-sent events, yielding text deltas (or, with a tool, its input JSON)."""
+    messages = [{"role": "user", "content": prompt}]
+    limiter = get_limiter("anthropic", model) if rate_limit_enabled() else None
+    estimated = estimate_tokens(messages, CLAUDE_SAMPLING["max_tokens"])
+    usage: Dict[str, int] = {}
+    data = {"model": model, "messages": messages, "stream": True, **CLAUDE_SAMPLING, **_claude_tool_params(tool)}
+    received = 0
+    finished = False
+    with _upstream_call("anthropic", model, "stream") as call, async_anthropic_session() as session:
+        try:
+            if limiter:
+                await limiter.acquire_async(estimated)
+            async with session.stream("POST", ANTHROPIC_URL, json=data, timeout=call_timeout()) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[5:])
+                    if event.get("type") == "message_start":
+                        usage.update(event["message"].get("usage") or {})
+                    elif event.get("type") == "message_delta":
+                        usage.update(event.get("usage") or {})
+                        finished = True
+                    elif event.get("type") == "content_block_delta" and event["delta"].get("type") == "text_delta":
+                        received += len(event["delta"]["text"])
+                        yield event["delta"]["text"]
+                    elif event.get("type") == "content_block_delta" and event["delta"].get("type") == "input_json_delta":
+                        received += len(event["delta"]["partial_json"])
+                        yield event["delta"]["partial_json"]
+                    elif event.get("type") == "error":
+                        raise RuntimeError(f"Claude stream error: {event.get('error')}")
+        finally:
+            if usage and not finished:
+                # Closed before the final usage (stopped early or cut off): estimate the output
+                usage["output_tokens"] = max(usage.get("output_tokens", 0), received // 4)
+                call.set(usage="estimated")
+            _record_tokens(call, "anthropic", model, usage.get("input_tokens"), usage.get("output_tokens"))
+            if limiter:
+                limiter.reconcile(estimated, _claude_usage_tokens(usage))
+
+class Provider:
+    """One upstream model behind a single-turn completion interface."""
+    name = ""
+    display_name = ""
+    # Return placeholder items instead of raising when generation fails
+    placeholder_on_error = False
+    # Completion cap sent upstream, if any (bounds what an early-stopped stream saved)
+    max_tokens: Optional[int] = None
+
+    def output_mode(self) -> str:
+        """How a schema passed to complete()/stream() is enforced; "prompt" means it is not."""
+        return "prompt"
+
+    async def complete(self, system: str, text: str, schema: Optional[dict] = None) -> str:
+        raise NotImplementedError
+
+    def stream(self, system: str, text: str, schema: Optional[dict] = None) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+class OpenAIProvider(Provider):
+    display_name = "GPT-4"
+    max_tokens = OPENAI_SAMPLING["max_tokens"]
+
+    def __init__(self, name: str = "gpt-4", model: Optional[str] = None):
+        self.name = name
+        self.model = model or os.getenv("OPENAI_MODEL", "gpt-4")
+
+    def _messages(self, system: str, text: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": system},
+            {"role": "user", "content": text}
+        ]
+
+    def output_mode(self) -> str:
+        return openai_output_mode(self.model)
+
+    async def complete(self, system: str, text: str, schema: Optional[dict] = None) -> str:
+        response = await call_openai_api_async(self._messages(system, text), model=self.model,
+                                               response_format=openai_response_format(self.model, schema))
+        return response.choices[0].message.content
+
+    def stream(self, system: str, text: str, schema: Optional[dict] = None) -> AsyncIterator[str]:
+        return stream_openai_api_async(self._messages(system, text), model=self.model,
+                                       response_format=openai_response_format(self.model, schema))
+
+class AnthropicProvider(Provider):
+    display_name = "Claude"
+    placeholder_on_error = True
+    max_tokens = CLAUDE_SAMPLING["max_tokens"]
+
+    def __init__(self, name: str = "claude", model: str = CLAUDE_MODEL):
+        self.name = name
+        self.model = model
+
+    def output_mode(self) -> str:
+        return "tool" if structured_output_enabled() else "prompt"
+
+    async def complete(self, system: str, text: str, schema: Optional[dict] = None) -> str:
+        return await call_claude_api_async(f"{system}\n\n{text}", model=self.model, tool=claude_tool(schema))
+
+    def stream(self, system: str, text: str, schema: Optional[dict] = None) -> AsyncIterator[str]:
+        return stream_claude_api_async(f"{system}\n\n{text}", model=self.model, tool=claude_tool(schema))
+
+class MockProvider(Provider):
+    """Deterministic offline provider: answers from the prompt itself, without network calls."""
+    display_name = "Mock"
+
+    def __init__(self, name: str = "mock", latency: Optional[float] = None):
+        self.name = name
+        self.latency = env_float("MOCK_PROVIDER_LATENCY", 0.0) if latency is None else latency
+
+    def _reply(self, system: str, text: str) -> str:
+        industry = re.search(r"specializing in ([^.]+)\.", system)
+        industry = industry.group(1) if industry else "general"
+        brief = " ".join(text.split()[:8])
+        variant = zlib.crc32(text.encode("utf-8")) % 1000
+        keys = re.search(r"keys?: ('\w+'(?: and '\w+')*)", system)
+        if not keys:
+            return f"{industry} idea #{variant} for {brief}"
+        count = re.search(r"exactly (\w+)", system)
+        count = 3 if not count or not count.group(1).isdigit() else int(count.group(1))
+        # Joint prompts ask for several keys; each gets its own run of ideas
+        return json.dumps({key: [f"{industry} idea #{variant + 100 * k + i} for {brief}" for i in range(count)]
+                           for k, key in enumerate(re.findall(r"'(\w+)'", keys.group(1)))})
+
+    async def complete(self, system: str, text: str, schema: Optional[dict] = None) -> str:
+        with _upstream_call("mock", self.name, "complete"):
+            await asyncio.sleep(self.latency)
+            return self._reply(system, text)
+
+    async def stream(self, system: str, text: str, schema: Optional[dict] = None) -> AsyncIterator[str]:
+        reply = self._reply(system, text)
+        chunks = [reply[i:i + 16] for i in range(0, len(reply), 16)]
+        with _upstream_call("mock", self.name, "stream"):
+            for chunk in chunks:
+                await asyncio.sleep(self.latency / max(1, len(chunks)))
+                yield chunk
+
+_providers: Dict[str, Provider] = {}
+
+def register_provider(provider: Provider) -> None:
+    """Make a provider available under its name (replacing any previous one)."""
+    _providers[provider.name] = provider
+
+def get_provider(name: str) -> Provider:
+    provider = _providers.get(name)
+    if provider is None:
+        raise ValueError(f"Unknown provider: {name}")
+    return provider
+
+def provider_names() -> List[str]:
+    return list(_providers)
+
+register_provider(OpenAIProvider())
+register_provider(AnthropicProvider())
+register_provider(MockProvider())
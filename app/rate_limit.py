@@ -0,0 +1,194 @@
+"""Client-side rate limiting for upstream LLM calls.
+
+Each (provider, model) pair gets a limiter with two token buckets: requests per
+minute and tokens per minute. A call reserves one request and an estimate of its
+tokens before it is sent and reconciles the estimate with the usage reported in
+the response. Callers that cannot proceed wait in FIFO order instead of failing,
+so a burst of clicks is smoothed out rather than turned into 429s.
+
+The limiter state is guarded by a threading lock, so the blocking acquire() used
+by synchronous code and the acquire_async() used by the async engine share the
+same budget.
+
+Configuration (environment variables):
+    RATE_LIMIT    "0" disables client-side limiting (default "1")
+    RATE_LIMITS   JSON overrides keyed by "provider" or "provider:model", e.g.
+                  {"openai:gpt-4": {"rpm": 500, "tpm": 40000}, "anthropic": {"rpm": 50}}
+"""
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from logs import get_logger
+from metrics import counter_func, gauge_func
+
+log = get_logger("rate_limit")
+
+DEFAULT_LIMITS = {
+    "openai": {"rpm": 500, "tpm": 80000},
+    "anthropic": {"rpm": 50, "tpm": 40000},
+}
+
+class TokenBucket:
+    """Bucket that refills continuously up to `capacity` over one minute."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available (0 if it is available now)."""
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits with FIFO waiting."""
+
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._lock = threading.Lock()
+        self._tickets = itertools.count()
+        self._queue: "deque[int]" = deque()
+        self.waited_seconds = 0.0
+        self.throttled = 0
+
+    def _try_acquire(self, ticket: int, tokens: float) -> float:
+        """Take capacity if this ticket is at the head of the queue; else return how long to wait."""
+        tokens = min(tokens, self.tokens.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if self._queue[0] != ticket:
+                # Not our turn yet; poll again shortly, or when the head could proceed
+                return max(wait, 0.01)
+            if wait > 0:
+                return wait
+            self.requests.level -= 1
+            self.tokens.level -= tokens
+            self._queue.popleft()
+            return 0.0
+
+    def _enqueue(self) -> int:
+        with self._lock:
+            ticket = next(self._tickets)
+            self._queue.append(ticket)
+            return ticket
+
+    def _dequeue(self, ticket: int) -> None:
+        with self._lock:
+            try:
+                self._queue.remove(ticket)
+            except ValueError:
+                pass
+
+    def acquire(self, tokens: float) -> float:
+        """Block until one request and `tokens` tokens are available; returns seconds waited."""
+        ticket = self._enqueue()
+        started = time.monotonic()
+        try:
+            while True:
+                wait = self._try_acquire(ticket, tokens)
+                if wait == 0:
+                    return self._record_wait(started)
+                time.sleep(wait)
+        finally:
+            self._dequeue(ticket)
+
+    async def acquire_async(self, tokens: float) -> float:
+        """Async counterpart of acquire()."""
+        ticket = self._enqueue()
+        started = time.monotonic()
+        try:
+            while True:
+                wait = self._try_acquire(ticket, tokens)
+                if wait == 0:
+                    return self._record_wait(started)
+                await asyncio.sleep(wait)
+        finally:
+            self._dequeue(ticket)
+
+    def _record_wait(self, started: float) -> float:
+        waited = time.monotonic() - started
+        if waited > 0.01:
+            with self._lock:
+                self.throttled += 1
+                self.waited_seconds += waited
+        return waited
+
+    def reconcile(self, estimated: float, actual: Optional[float]) -> None:
+        """Correct the token bucket once the real usage of a call is known."""
+        if actual is None:
+            return
+        with self._lock:
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + min(estimated, self.tokens.capacity) - actual)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "queued": len(self._queue),
+                "throttled": self.throttled,
+                "waited_seconds": round(self.waited_seconds, 3),
+                "requests_available": round(self.requests.level, 1),
+                "tokens_available": round(self.tokens.level, 1),
+            }
+
+_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def rate_limit_enabled() -> bool:
+    return os.getenv("RATE_LIMIT", "1") != "0"
+
+def _configured_limits(provider: str, model: str) -> Dict[str, float]:
+    limits = dict(DEFAULT_LIMITS.get(provider, {"rpm": 60, "tpm": 40000}))
+    try:
+        overrides = json.loads(os.getenv("RATE_LIMITS", "{}"))
+    except ValueError:
+        log.warning("ignoring invalid RATE_LIMITS JSON")
+        overrides = {}
+    limits.update(overrides.get(provider, {}))
+    limits.update(overrides.get(f"{provider}:{model}", {}))
+    return limits
+
+def get_limiter(provider: str, model: str) -> RateLimiter:
+    """Return the shared limiter for a provider/model pair."""
+    key = (provider, model)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limits = _configured_limits(provider, model)
+            limiter = RateLimiter(limits["rpm"], limits["tpm"])
+            _limiters[key] = limiter
+        return limiter
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+    """Rough pre-call token estimate: ~4 characters per prompt token plus the completion budget."""
+    prompt_chars = sum(len(message.get("content", "")) for message in messages)
+    return prompt_chars // 4 + 4 * len(messages) + max_tokens
+
+def rate_limit_stats() -> Dict[str, Dict[str, float]]:
+    with _limiters_lock:
+        return {f"{provider}:{model}": limiter.stats() for (provider, model), limiter in _limiters.items()}
+
+def _limiter_values(field: str) -> Dict[Tuple[str, ...], float]:
+    return {(name,): stats[field] for name, stats in rate_limit_stats().items()}
+
+counter_func("rate_limit_throttled_total", "Calls that had to wait for the limiter", ["limiter"], lambda: _limiter_values("throttled"))
+counter_func("rate_limit_wait_seconds_total", "Seconds calls spent waiting for the limiter", ["limiter"], lambda: _limiter_values("waited_seconds"))
+gauge_func("rate_limit_queued", "Calls waiting for the limiter", ["limiter"], lambda: _limiter_values("queued"))
+gauge_func("rate_limit_requests_available", "Requests left in the limiter's bucket", ["limiter"], lambda: _limiter_values("requests_available"))
+gauge_func("rate_limit_tokens_available", "Tokens left in the limiter's bucket", ["limiter"], lambda: _limiter_values("tokens_available"))
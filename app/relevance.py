@@ -0,0 +1,233 @@
+"""Pluggable industry-relevance backends.
+
+The generators only need a yes/no answer for one of a fixed set of industries,
+so most items can be judged locally by a hashed n-gram logistic model in a few
+microseconds. Only items whose score lands in the uncertain band are sent to
+the LLM judge.
+
+Backends (RELEVANCE_BACKEND):
+    llm     every item is judged by the LLM
+    local   every item is judged by the local model
+    hybrid  local model first, LLM only for uncertain items (default)
+
+The local model is seeded from per-industry vocabularies shipped in this module
+(words specific to one industry; generic ones such as "live" or "look" would
+accept unrelated items). A keyword hit is good evidence, but a miss is not:
+the seed model knows a few words per industry and does no stemming, so
+"workouts" misses "workout". Until a trained model is loaded, the hybrid
+backend therefore only accepts items locally and sends every other item to
+the LLM. The model can be retrained from logged LLM verdicts with train_relevance.py.
+"""
+import json
+import math
+import os
+import re
+import threading
+import zlib
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from logs import get_logger
+
+log = get_logger("relevance")
+
+NUM_BUCKETS = 1 << 18
+# Seed calibration against the default (0.2, 0.8) band: two keywords score 0.88 and
+# are accepted locally, one scores 0.5 and none 0.12, and both go to the LLM (see
+# hybrid_band); RELEVANCE_BACKEND=local reads 0.12 as irrelevant
+SEED_KEYWORD_WEIGHT = 2.0
+SEED_BIAS = -2.0
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "relevance_model.json")
+
+INDUSTRY_VOCABULARY: Dict[str, List[str]] = {
+    "Lifestyle": ["lifestyle", "daily routine", "self care", "wellness", "decor", "mindfulness", "morning", "weekend", "vibes", "cozy", "everyday", "balance", "habits", "inspiration", "aesthetic", "living"],
+    "Fitness": ["fitness", "workout", "gym", "training", "exercise", "cardio", "strength", "reps", "muscle", "hiit", "yoga", "run", "running", "personal best", "sweat", "athlete", "protein", "endurance", "stretch"],
+    "Music": ["music", "song", "album", "playlist", "track", "beat", "concert", "tour", "artist", "band", "lyrics", "vinyl", "studio", "dj", "melody", "remix", "festival"],
+    "Fashion": ["fashion", "style", "outfit", "ootd", "wardrobe", "collection", "runway", "designer", "trend", "streetwear", "couture", "denim", "accessories", "lookbook", "wear", "sustainable fashion"],
+    "Food": ["food", "recipe", "cook", "cooking", "chef", "kitchen", "meal", "flavor", "flavour", "dish", "taste", "delicious", "bake", "baking", "restaurant", "brunch", "ingredients", "snack", "foodie", "dinner"],
+    "Tech": ["tech", "technology", "app", "software", "device", "gadget", "ai", "digital", "innovation", "smartphone", "startup", "code", "coding", "cloud", "data", "launch", "smart"],
+    "Travel": ["travel", "trip", "destination", "journey", "adventure", "wanderlust", "explore", "flight", "hotel", "passport", "vacation", "getaway", "itinerary", "beach", "road trip", "backpacking", "tourism", "local guide"],
+    "Gaming": ["gaming", "game", "gamer", "player", "console", "pc", "esports", "twitch", "level", "quest", "multiplayer", "controller", "speedrun", "boss", "loot", "leaderboard", "gameplay"],
+    "Parenting": ["parenting", "parent", "parents", "mom", "dad", "kids", "kid", "baby", "toddler", "family", "children", "child", "bedtime", "school run", "newborn", "motherhood", "fatherhood", "family time"],
+    "Education": ["education", "learn", "learning", "student", "students", "teacher", "school", "class", "course", "lesson", "study", "knowledge", "skills", "tutorial", "campus", "exam", "curriculum", "classroom", "online course"],
+    "Entertainment": ["entertainment", "movie", "film", "show", "series", "tv", "premiere", "trailer", "celebrity", "binge", "episode", "cast", "streaming", "watch", "box office", "bts", "red carpet", "season"],
+    "Beauty": ["beauty", "skincare", "makeup", "glow", "serum", "lipstick", "foundation", "routine", "skin", "hair", "nails", "cosmetics", "moisturizer", "spf", "lashes", "glam", "fragrance", "self care"],
+    "Sports": ["sports", "sport", "team", "match", "game day", "league", "fans", "season", "score", "goal", "championship", "coach", "stadium", "football", "basketball", "soccer", "tennis", "playoffs"],
+    "Comedy": ["comedy", "funny", "laugh", "joke", "jokes", "humor", "humour", "stand up", "sketch", "meme", "hilarious", "punchline", "prank", "comedian", "lol", "relatable", "parody", "roast"],
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9#']+")
+
+def _bucket(feature: str) -> int:
+    return zlib.crc32(feature.encode("utf-8")) & (NUM_BUCKETS - 1)
+
+def extract_features(text: str) -> List[int]:
+    """Hash the unigrams and bigrams of a text into feature buckets."""
+    tokens = [token.strip("'#") for token in _TOKEN_RE.findall(text.lower())]
+    tokens = [token for token in tokens if token]
+    features = {_bucket(token) for token in tokens}
+    features.update(_bucket(f"{a} {b}") for a, b in zip(tokens, tokens[1:]))
+    return list(features)
+
+def _sigmoid(x: float) -> float:
+    if x >= 0:
+        return 1.0 / (1.0 + math.exp(-x))
+    z = math.exp(x)
+    return z / (1.0 + z)
+
+class HashedLinearModel:
+    """One sparse logistic-regression model per industry over hashed n-grams."""
+
+    def __init__(self, weights: Optional[Dict[str, Dict[int, float]]] = None, bias: Optional[Dict[str, float]] = None):
+        self.weights = weights or {}
+        self.bias = bias or {}
+        # Built from the keyword vocabularies rather than trained on verdicts
+        self.seeded = False
+
+    @classmethod
+    def from_vocabulary(cls, vocabulary: Dict[str, List[str]] = INDUSTRY_VOCABULARY) -> "HashedLinearModel":
+        """Build an untrained model that scores items by industry keyword hits."""
+        weights = {}
+        for industry, keywords in vocabulary.items():
+            weights[industry] = {_bucket(keyword.lower()): SEED_KEYWORD_WEIGHT for keyword in keywords}
+        model = cls(weights, {industry: SEED_BIAS for industry in vocabulary})
+        model.seeded = True
+        return model
+
+    @classmethod
+    def load(cls, path: str) -> "HashedLinearModel":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        weights = {
+            industry: {int(feature): float(weight) for feature, weight in industry_weights.items()}
+            for industry, industry_weights in data["weights"].items()
+        }
+        return cls(weights, {industry: float(b) for industry, b in data["bias"].items()})
+
+    def save(self, path: str) -> None:
+        data = {
+            "num_buckets": NUM_BUCKETS,
+            "weights": {
+                industry: {str(feature): round(weight, 6) for feature, weight in industry_weights.items() if weight}
+                for industry, industry_weights in self.weights.items()
+            },
+            "bias": self.bias,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    def score(self, text: str, industry: str) -> float:
+        """Return the probability that the text is relevant to the industry."""
+        weights = self.weights.get(industry, {})
+        total = self.bias.get(industry, SEED_BIAS)
+        for feature in extract_features(text):
+            total += weights.get(feature, 0.0)
+        return _sigmoid(total)
+
+    def train(self, examples: Iterable[Tuple[str, str, bool]], epochs: int = 5, learning_rate: float = 0.2, l2: float = 1e-4) -> None:
+        """Fit the model with SGD on (text, industry, is_relevant) examples."""
+        self.seeded = False
+        examples = [(extract_features(text), industry, 1.0 if label else 0.0) for text, industry, label in examples]
+        for _ in range(epochs):
+            for features, industry, label in examples:
+                weights = self.weights.setdefault(industry, {})
+                total = self.bias.get(industry, SEED_BIAS) + sum(weights.get(f, 0.0) for f in features)
+                gradient = _sigmoid(total) - label
+                self.bias[industry] = self.bias.get(industry, SEED_BIAS) - learning_rate * gradient
+                for f in features:
+                    w = weights.get(f, 0.0)
+                    weights[f] = w - learning_rate * (gradient + l2 * w)
+
+class RelevanceBackend:
+    """Scores items for industry relevance; scores >= 0.5 count as relevant."""
+
+    async def score(self, texts: List[str], industry: str) -> List[float]:
+        raise NotImplementedError
+
+    async def validate(self, texts: List[str], industry: str) -> List[bool]:
+        return [score >= 0.5 for score in await self.score(texts, industry)]
+
+class LocalRelevanceBackend(RelevanceBackend):
+    def __init__(self, model: HashedLinearModel):
+        self.model = model
+
+    async def score(self, texts: List[str], industry: str) -> List[float]:
+        return [self.model.score(text, industry) for text in texts]
+
+class LLMRelevanceBackend(RelevanceBackend):
+    """Wraps a batched LLM validator such as validate_industry_relevance_batch_async."""
+
+    def __init__(self, validate_batch: Callable[[List[str], str], Awaitable[List[bool]]]):
+        self.validate_batch = validate_batch
+
+    async def score(self, texts: List[str], industry: str) -> List[float]:
+        if not texts:
+            return []
+        return [1.0 if verdict else 0.0 for verdict in await self.validate_batch(texts, industry)]
+
+class HybridRelevanceBackend(RelevanceBackend):
+    """Local model for confident scores, LLM for scores inside the uncertain band."""
+
+    def __init__(self, local: LocalRelevanceBackend, llm: LLMRelevanceBackend, band: Tuple[float, float] = (0.2, 0.8)):
+        self.local = local
+        self.llm = llm
+        self.band = band
+
+    async def score(self, texts: List[str], industry: str) -> List[float]:
+        scores = await self.local.score(texts, industry)
+        low, high = hybrid_band(self.local.model, self.band)
+        uncertain = [i for i, score in enumerate(scores) if low < score < high]
+        if uncertain:
+            llm_scores = await self.llm.score([texts[i] for i in uncertain], industry)
+            for i, llm_score in zip(uncertain, llm_scores):
+                scores[i] = llm_score
+        return scores
+
+def hybrid_band(model: HashedLinearModel, band: Tuple[float, float]) -> Tuple[float, float]:
+    """The scores a hybrid backend sends to the LLM; a seed model rejects nothing locally."""
+    low, high = band
+    return (0.0 if model.seeded else low), high
+
+_model: Optional[HashedLinearModel] = None
+_model_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+def get_local_model() -> HashedLinearModel:
+    """Load the trained model if one exists, otherwise seed it from the vocabularies."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            path = os.getenv("RELEVANCE_MODEL_PATH", DEFAULT_MODEL_PATH)
+            if os.path.exists(path):
+                _model = HashedLinearModel.load(path)
+            else:
+                _model = HashedLinearModel.from_vocabulary()
+        return _model
+
+def _uncertain_band() -> Tuple[float, float]:
+    try:
+        low, high = (float(x) for x in os.getenv("RELEVANCE_UNCERTAIN_BAND", "0.2,0.8").split(","))
+        return low, high
+    except ValueError:
+        return 0.2, 0.8
+
+def make_backend(name: str, validate_batch: Callable[[List[str], str], Awaitable[List[bool]]]) -> RelevanceBackend:
+    """Build the named backend; validate_batch is the LLM judge used by llm and hybrid."""
+    if name == "llm":
+        return LLMRelevanceBackend(validate_batch)
+    if name == "local":
+        return LocalRelevanceBackend(get_local_model())
+    if name == "hybrid":
+        return HybridRelevanceBackend(LocalRelevanceBackend(get_local_model()), LLMRelevanceBackend(validate_batch), _uncertain_band())
+    raise ValueError(f"Unknown relevance backend: {name}")
+
+def log_verdict(text: str, industry: str, is_relevant: bool) -> None:
+    """Append an LLM verdict to RELEVANCE_VERDICT_LOG (JSONL) for later training."""
+    path = os.getenv("RELEVANCE_VERDICT_LOG")
+    if not path:
+        return
+    record = {"text": text, "industry": industry, "is_relevant": is_relevant}
+    try:
+        with _log_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        log.warning("relevance verdict log write failed", error=str(e))
@@ -0,0 +1,229 @@
+"""Persistent store of generated results.
+
+Every finished generation (captions or content ideas) is recorded in an
+embedded SQLite database in WAL mode: the brief's hash, industry, model,
+items, per-item verdicts, latencies and token usage. Lookups by (brief_hash,
+industry, model) and by time are indexed.
+
+Writes never touch the request path: record() puts the row on a queue and a
+background thread inserts queued rows in batches, one transaction per batch.
+Reads use a per-thread connection, which WAL lets run alongside the writer:
+
+    store = get_results_store()
+    if store:
+        previous = store.latest(brief, "Fitness", "gpt-4", "captions")
+        rows = store.query(industry="Fitness", since=time.time() - 86400)
+
+Configuration (environment variables):
+    RESULTS_DB               path of the SQLite file (unset = results are not stored)
+    RESULTS_BATCH_SIZE       rows written per transaction at most (default 100)
+    RESULTS_FLUSH_SECONDS    longest a queued row waits before it is written (default 0.5)
+    RESULTS_REUSE_SECONDS    serve a stored result for an identical brief, industry,
+                             model and kind younger than this instead of generating
+                             again (default 0, never)
+"""
+import atexit
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from env import env_float
+from logs import get_logger
+
+log = get_logger("results_store")
+
+COLUMNS = [
+    "created_at", "request_id", "brief_hash", "industry", "model", "kind", "stream",
+    "items", "verdicts", "latencies", "prompt_tokens", "completion_tokens", "cost",
+]
+JSON_COLUMNS = {"items", "verdicts", "latencies"}
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS results (
+        id INTEGER PRIMARY KEY,
+        created_at REAL NOT NULL,
+        request_id TEXT,
+        brief_hash TEXT NOT NULL,
+        industry TEXT NOT NULL,
+        model TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        stream INTEGER NOT NULL DEFAULT 0,
+        items TEXT NOT NULL,
+        verdicts TEXT,
+        latencies TEXT,
+        prompt_tokens INTEGER NOT NULL DEFAULT 0,
+        completion_tokens INTEGER NOT NULL DEFAULT 0,
+        cost REAL NOT NULL DEFAULT 0
+    )""",
+    "CREATE INDEX IF NOT EXISTS results_lookup ON results (brief_hash, industry, model, created_at)",
+    "CREATE INDEX IF NOT EXISTS results_created ON results (created_at)",
+]
+
+def brief_hash(brief: str) -> str:
+    """SHA-256 of the brief with whitespace normalised, so trivial edits still match."""
+    return hashlib.sha256(" ".join(brief.split()).encode("utf-8")).hexdigest()
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _decode(row: sqlite3.Row) -> Dict[str, Any]:
+    result = dict(row)
+    for column in JSON_COLUMNS:
+        if result.get(column) is not None:
+            result[column] = json.loads(result[column])
+    result["stream"] = bool(result["stream"])
+    return result
+
+class ResultsStore:
+    def __init__(self, path: str, batch_size: Optional[int] = None, flush_seconds: Optional[float] = None):
+        self.path = path
+        self.batch_size = int(env_float("RESULTS_BATCH_SIZE", 100)) if batch_size is None else batch_size
+        self.flush_seconds = env_float("RESULTS_FLUSH_SECONDS", 0.5) if flush_seconds is None else flush_seconds
+        self.written = 0
+        self.failed = 0
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._local = threading.local()
+        writer = _connect(path)
+        for statement in SCHEMA:
+            writer.execute(statement)
+        writer.commit()
+        self._writer = threading.Thread(target=self._write_loop, args=(writer,), name="results-writer", daemon=True)
+        self._writer.start()
+
+    # -- Writes --
+
+    def record(self, brief: str, industry: str, model: str, kind: str, items: List[str],
+               verdicts: Optional[List[Optional[bool]]] = None, latencies: Optional[Dict[str, float]] = None,
+               prompt_tokens: int = 0, completion_tokens: int = 0, cost: float = 0.0,
+               request_id: Optional[str] = None, stream: bool = False) -> None:
+        """Queue one result for the background writer; never blocks on the database."""
+        self._queue.put({
+            "created_at": time.time(),
+            "request_id": request_id,
+            "brief_hash": brief_hash(brief),
+            "industry": industry,
+            "model": model,
+            "kind": kind,
+            "stream": int(stream),
+            "items": json.dumps(items),
+            "verdicts": json.dumps(verdicts) if verdicts is not None else None,
+            "latencies": json.dumps(latencies) if latencies is not None else None,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost": cost,
+        })
+
+    def _write_loop(self, conn: sqlite3.Connection) -> None:
+        insert = f"INSERT INTO results ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})"
+        stopping = False
+        while not stopping:
+            row = self._queue.get()
+            if row is None:
+                self._queue.task_done()
+                break
+            batch = [row]
+            # Give rows queued right behind this one a moment to join the batch
+            flush_at = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    row = self._queue.get(timeout=max(0.0, flush_at - time.monotonic()))
+                except queue.Empty:
+                    break
+                if row is None:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(row)
+            try:
+                with conn:
+                    conn.executemany(insert, [tuple(item[column] for column in COLUMNS) for item in batch])
+                self.written += len(batch)
+            except sqlite3.Error as e:
+                self.failed += len(batch)
+                log.warning("results write failed", rows=len(batch), error=str(e))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        conn.close()
+
+    def flush(self) -> None:
+        """Block until every queued row has been written (or has failed)."""
+        self._queue.join()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._writer.join(timeout=5)
+
+    # -- Reads --
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = _connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def latest(self, brief: str, industry: str, model: str, kind: Optional[str] = None, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Most recent result for this brief, industry and model (and kind), if any."""
+        sql = "SELECT * FROM results WHERE brief_hash = ? AND industry = ? AND model = ?"
+        params: List[Any] = [brief_hash(brief), industry, model]
+        if kind is not None:
+            sql += " AND kind = ?"
+            params.append(kind)
+        if max_age is not None:
+            sql += " AND created_at >= ?"
+            params.append(time.time() - max_age)
+        row = self._reader().execute(sql + " ORDER BY created_at DESC LIMIT 1", params).fetchone()
+        return _decode(row) if row is not None else None
+
+    def query(self, brief: Optional[str] = None, industry: Optional[str] = None, model: Optional[str] = None,
+              kind: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None,
+              limit: int = 100, digest: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Results matching every given filter, newest first; `digest` is a brief_hash() value."""
+        if brief is not None:
+            digest = brief_hash(brief)
+        clauses, params = [], []
+        for column, value in (("brief_hash", digest),
+                              ("industry", industry), ("model", model), ("kind", kind)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._reader().execute(f"SELECT * FROM results{where} ORDER BY created_at DESC LIMIT ?", params + [limit]).fetchall()
+        return [_decode(row) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": self._queue.qsize(), "written": self.written, "failed": self.failed}
+
+_store: Optional[ResultsStore] = None
+_store_lock = threading.Lock()
+
+def get_results_store() -> Optional[ResultsStore]:
+    """The shared store for RESULTS_DB, or None when results are not stored."""
+    global _store
+    path = os.getenv("RESULTS_DB")
+    if not path:
+        return None
+    with _store_lock:
+        if _store is None or _store.path != path:
+            _store = ResultsStore(path)
+            atexit.register(_store.close)
+        return _store
+
+def reuse_seconds() -> float:
+    return env_float("RESULTS_REUSE_SECONDS", 0)
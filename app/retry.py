@@ -0,0 +1,239 @@
+"""Retry policy for upstream LLM calls.
+
+Transient failures (connection errors, timeouts, 408/409/425/429/5xx and
+Anthropic's 529 "overloaded") are retried with exponential backoff and full
+jitter. Timeouts of a single attempt are retried too, but never past the
+click's deadline (see deadline.py). When the provider says how long to wait, through Retry-After,
+retry-after-ms, x-ratelimit-reset-* or anthropic-ratelimit-*-reset, that delay
+is used instead. Each click gets a RetryBudget that caps the total number of
+retries and the total time spent waiting across all of its upstream calls, so
+one flaky click cannot retry forever.
+
+Configuration (environment variables):
+    RETRY_MAX_ATTEMPTS     attempts per upstream call, including the first (default 4)
+    RETRY_BASE_DELAY       first backoff ceiling in seconds (default 0.5)
+    RETRY_MAX_DELAY        largest single backoff in seconds (default 20)
+    RETRY_BUDGET_RETRIES   retries allowed per click across all calls (default 8)
+    RETRY_BUDGET_SECONDS   seconds of backoff allowed per click (default 30)
+"""
+import asyncio
+import contextlib
+import contextvars
+import email.utils
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional, TypeVar
+
+import httpx
+from openai import APIConnectionError
+
+from deadline import DeadlineExceeded, current_deadline
+from env import env_float
+from logs import get_logger
+from tracing import current_span
+
+log = get_logger("retry")
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+
+class RetryBudget:
+    """Retries and backoff time shared by all upstream calls of one click."""
+
+    def __init__(self, max_retries: Optional[int] = None, max_seconds: Optional[float] = None):
+        self.max_retries = int(env_float("RETRY_BUDGET_RETRIES", 8)) if max_retries is None else max_retries
+        self.max_seconds = env_float("RETRY_BUDGET_SECONDS", 30) if max_seconds is None else max_seconds
+        self.retries = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def spend(self, delay: float) -> bool:
+        """Reserve one retry that waits `delay` seconds; False if the budget is exhausted."""
+        with self._lock:
+            if self.retries >= self.max_retries or self.seconds + delay > self.max_seconds:
+                return False
+            self.retries += 1
+            self.seconds += delay
+            return True
+
+_budget: contextvars.ContextVar[Optional[RetryBudget]] = contextvars.ContextVar("retry_budget", default=None)
+
+@contextlib.contextmanager
+def retry_budget(budget: Optional[RetryBudget] = None) -> Iterator[RetryBudget]:
+    """Install a retry budget for the calls made inside the block (and tasks it starts)."""
+    budget = budget or RetryBudget()
+    token = _budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _budget.reset(token)
+
+def current_budget() -> Optional[RetryBudget]:
+    return _budget.get()
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    return status
+
+def _headers(exc: BaseException):
+    response = getattr(exc, "response", None)
+    return getattr(response, "headers", None) or {}
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether an upstream error is worth retrying."""
+    should_retry = _headers(exc).get("x-should-retry")
+    if should_retry in ("true", "false"):
+        return should_retry == "true"
+    if isinstance(exc, DeadlineExceeded):
+        return False
+    if isinstance(exc, (httpx.TransportError, APIConnectionError, asyncio.TimeoutError, TimeoutError)):
+        return True
+    return _status_code(exc) in RETRYABLE_STATUS
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Parse OpenAI-style reset durations such as '1s', '6m0s' or '20ms'."""
+    parts = _DURATION_RE.findall(value)
+    if not parts or "".join(number + unit for number, unit in parts) != value.replace(" ", ""):
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+def _parse_timestamp(value: str) -> Optional[float]:
+    """Seconds until an RFC 3339 or HTTP-date timestamp."""
+    try:
+        when = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+def _explicit_retry_after(headers) -> Optional[float]:
+    """Delay from Retry-After / retry-after-ms, which the provider expects us to honour."""
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if headers.get("retry-after"):
+        value = headers["retry-after"]
+        try:
+            return float(value)
+        except ValueError:
+            return _parse_timestamp(value)
+    return None
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """The delay the provider asked for, if any."""
+    headers = _headers(exc)
+    explicit = _explicit_retry_after(headers)
+    if explicit is not None:
+        return explicit
+    resets = []
+    for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        if headers.get(name):
+            resets.append(_parse_duration(headers[name]))
+    for name in ("anthropic-ratelimit-requests-reset", "anthropic-ratelimit-tokens-reset",
+                 "anthropic-ratelimit-input-tokens-reset", "anthropic-ratelimit-output-tokens-reset"):
+        if headers.get(name):
+            resets.append(_parse_timestamp(headers[name]))
+    resets = [reset for reset in resets if reset is not None]
+    return max(resets) if resets else None
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+    ceiling = min(env_float("RETRY_MAX_DELAY", 20), env_float("RETRY_BASE_DELAY", 0.5) * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+def _next_delay(exc: BaseException, attempt: int, budget: RetryBudget) -> Optional[float]:
+    """Delay before the next attempt, or None if the call should not be retried."""
+    if attempt + 1 >= int(env_float("RETRY_MAX_ATTEMPTS", 4)) or not is_retryable(exc):
+        return None
+    max_delay = env_float("RETRY_MAX_DELAY", 20)
+    explicit = _explicit_retry_after(_headers(exc))
+    if explicit is not None and explicit > max_delay:
+        # Retrying sooner than the provider asked would only earn another 429
+        log.warning("provider asked to retry later than RETRY_MAX_DELAY, giving up", retry_after=explicit)
+        return None
+    delay = retry_after_seconds(exc)
+    if delay is None:
+        delay = backoff_delay(attempt)
+    # Reset headers say when the whole window refills; capacity usually returns sooner
+    delay = min(delay, max_delay)
+    deadline = current_deadline()
+    if deadline is not None and not deadline.allows(delay + 1):
+        log.warning("not enough time left before the deadline to retry, giving up", delay=round(delay, 3))
+        return None
+    if not budget.spend(delay):
+        log.warning("retry budget exhausted, giving up", retries=budget.retries)
+        return None
+    return delay
+
+async def retry_async(call: Callable[[], Awaitable[T]], description: str = "upstream call", budget: Optional[RetryBudget] = None) -> T:
+    """Await call(), retrying transient failures under the click's retry budget."""
+    budget = budget or current_budget() or RetryBudget()
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as e:
+            delay = _next_delay(e, attempt, budget)
+            if delay is None:
+                raise
+            log.info("retrying upstream call", call=description, error=str(e), attempt=attempt + 1, delay=round(delay, 3))
+            current_span().increment("retries")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+def retry_sync(call: Callable[[], T], description: str = "upstream call", budget: Optional[RetryBudget] = None) -> T:
+    """Blocking counterpart of retry_async."""
+    budget = budget or current_budget() or RetryBudget()
+    attempt = 0
+    while True:
+        try:
+            return call()
+        except Exception as e:
+            delay = _next_delay(e, attempt, budget)
+            if delay is None:
+                raise
+            log.info("retrying upstream call", call=description, error=str(e), attempt=attempt + 1, delay=round(delay, 3))
+            current_span().increment("retries")
+            time.sleep(delay)
+            attempt += 1
+
+async def retry_stream(open_stream: Callable[[], AsyncIterator[T]], description: str = "upstream stream", budget: Optional[RetryBudget] = None) -> AsyncIterator[T]:
+    """Iterate a stream, retrying from scratch only if it fails before yielding anything."""
+    budget = budget or current_budget() or RetryBudget()
+    attempt = 0
+    while True:
+        started = False
+        stream = open_stream()
+        try:
+            async for item in stream:
+                started = True
+                yield item
+            return
+        except Exception as e:
+            delay = None if started else _next_delay(e, attempt, budget)
+            if delay is None:
+                raise
+            log.info("retrying upstream call", call=description, error=str(e), attempt=attempt + 1, delay=round(delay, 3))
+            current_span().increment("retries")
+            await asyncio.sleep(delay)
+            attempt += 1
+        finally:
+            # Close the attempt now rather than when it is garbage collected,
+            # so a consumer that stops early releases the upstream connection
+            await stream.aclose()
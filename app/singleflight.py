@@ -0,0 +1,152 @@
+"""In-flight request coalescing.
+
+Concurrent callers that ask for the same key share one execution: the first
+caller runs the work and everyone else awaits its result. The shared state is a
+thread-safe concurrent.futures.Future, so callers on different threads or
+different event loops coalesce onto the same call. If the caller running the
+work is cancelled, one of the waiting callers takes over and runs it again.
+
+Streams are shared the same way (stream()): the first caller's stream runs
+in a task of its own and every caller, the first included, reads it from the
+start. Items are handed on through a chain of futures, each resolving to an
+item and the future of the next one, so a caller that joins late replays
+what it missed and a caller that goes away does not stop the stream for the
+others. Once the last reader has gone, the stream is cancelled, so an
+abandoned click stops spending on upstream calls.
+"""
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Optional
+
+# Resolves the last future of a shared stream's chain
+_END = object()
+# Resolves a call whose leader was cancelled; its followers try again
+_ABANDONED = object()
+
+class _SharedStream:
+    """One stream being read by several callers."""
+    __slots__ = ("head", "producer", "readers")
+
+    def __init__(self):
+        # Resolves to (first item, future of the next one) or _END
+        self.head: concurrent.futures.Future = concurrent.futures.Future()
+        self.producer: Optional[asyncio.Task] = None
+        self.readers = 0
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, concurrent.futures.Future] = {}
+        self._streams: Dict[Hashable, _SharedStream] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, work: Callable[[], Awaitable[Any]]) -> Any:
+        """Run work() once per key among concurrent callers and share its result.
+
+        A leader that is cancelled (its click went away) does not cancel the
+        followers: the first of them to retry becomes the new leader.
+        """
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                is_leader = future is None
+                if is_leader:
+                    future = concurrent.futures.Future()
+                    self._calls[key] = future
+                    self.leaders += 1
+                else:
+                    self.followers += 1
+
+            if not is_leader:
+                # Shield so a cancelled follower does not cancel the shared future
+                result = await asyncio.shield(asyncio.wrap_future(future))
+                if result is _ABANDONED:
+                    continue
+                return result
+
+            try:
+                result = await work()
+            except asyncio.CancelledError:
+                self._finish(key)
+                future.set_result(_ABANDONED)
+                raise
+            except BaseException as e:
+                self._finish(key)
+                future.set_exception(e)
+                raise
+            self._finish(key)
+            future.set_result(result)
+            return result
+
+    def _finish(self, key: Hashable) -> None:
+        # Before the future resolves, so a retrying follower starts a new call
+        with self._lock:
+            self._calls.pop(key, None)
+
+    async def stream(self, key: Hashable, open_stream: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Iterate open_stream() once per key among concurrent callers; each caller gets every item."""
+        with self._lock:
+            shared = self._streams.get(key)
+            is_leader = shared is None
+            if is_leader:
+                shared = _SharedStream()
+                self._streams[key] = shared
+                self.leaders += 1
+            else:
+                self.followers += 1
+            shared.readers += 1
+
+        if is_leader:
+            # Runs in the leader's context (spans, budgets) but outlives its reader
+            shared.producer = asyncio.ensure_future(self._produce(key, shared, open_stream))
+
+        node = shared.head
+        try:
+            while True:
+                # Shield so a reader that goes away does not cancel the shared chain
+                entry = await asyncio.shield(asyncio.wrap_future(node))
+                if entry is _END:
+                    return
+                item, node = entry
+                yield item
+        finally:
+            self._leave(key, shared)
+
+    def _leave(self, key: Hashable, shared: "_SharedStream") -> None:
+        """Drop a reader; the last one to go stops a stream nobody is reading."""
+        with self._lock:
+            shared.readers -= 1
+            if shared.readers > 0:
+                return
+            # Later callers start a stream of their own
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+        producer = shared.producer
+        if producer is not None and not producer.done():
+            producer.get_loop().call_soon_threadsafe(producer.cancel)
+
+    async def _produce(self, key: Hashable, shared: "_SharedStream", open_stream: Callable[[], AsyncIterator[Any]]) -> None:
+        node = shared.head
+        try:
+            async for item in open_stream():
+                following = concurrent.futures.Future()
+                node.set_result((item, following))
+                node = following
+        except BaseException as e:
+            self._finish_stream(key, shared)
+            node.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+        else:
+            self._finish_stream(key, shared)
+            node.set_result(_END)
+
+    def _finish_stream(self, key: Hashable, shared: "_SharedStream") -> None:
+        with self._lock:
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"leaders": self.leaders, "followers": self.followers, "in_flight": len(self._calls) + len(self._streams)}
@@ -0,0 +1,150 @@
+"""Local stand-in for an OTLP trace collector.
+
+Accepts OTLP/HTTP JSON on POST /v1/traces, the format tracing.py's "otlp"
+exporter sends, so traces can be inspected without running a real
+collector:
+
+    python trace_collector.py --port 4318 --output collected_traces.jsonl
+    TRACE_EXPORT=otlp TRACE_OTLP_ENDPOINT=http://127.0.0.1:4318/v1/traces python app.py
+
+Received spans are appended to --output as one JSON line each, in the same
+shape the "jsonl" exporter writes. GET /traces lists the slowest traces seen
+so far (root span, duration, span count); GET /traces/<trace_id> returns the
+spans of one trace.
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+def _attribute_value(value: Dict[str, Any]) -> Any:
+    if "intValue" in value:
+        return int(value["intValue"])
+    for key in ("stringValue", "doubleValue", "boolValue"):
+        if key in value:
+            return value[key]
+    return None
+
+def flatten(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Turn an OTLP/JSON export request into flat span dicts."""
+    spans = []
+    for resource in payload.get("resourceSpans", []):
+        for scope in resource.get("scopeSpans", []):
+            for item in scope.get("spans", []):
+                start = int(item.get("startTimeUnixNano", 0))
+                end = int(item.get("endTimeUnixNano", start))
+                status = item.get("status", {})
+                spans.append({
+                    "trace_id": item.get("traceId"),
+                    "span_id": item.get("spanId"),
+                    "parent_id": item.get("parentSpanId"),
+                    "name": item.get("name"),
+                    "start": start / 1e9,
+                    "duration_ms": round((end - start) / 1e6, 3),
+                    "status": {2: "error", 1: "ok"}.get(status.get("code"), "cancelled"),
+                    "error": status.get("message"),
+                    "attributes": {attr["key"]: _attribute_value(attr.get("value", {})) for attr in item.get("attributes", [])},
+                })
+    return spans
+
+class CollectorState:
+    def __init__(self, output: Optional[str], keep: int = 1000):
+        self.output = output
+        self.keep = keep
+        self.traces: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, spans: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            for item in spans:
+                self.traces.setdefault(item["trace_id"], []).append(item)
+            # Oldest traces go first once more than `keep` are held
+            while len(self.traces) > self.keep:
+                self.traces.pop(next(iter(self.traces)))
+            if self.output:
+                with open(self.output, "a", encoding="utf-8") as f:
+                    for item in spans:
+                        f.write(json.dumps(item) + "\n")
+
+    def summary(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            traces = list(self.traces.items())
+        rows = []
+        for trace_id, spans in traces:
+            root = next((item for item in spans if not item["parent_id"]), None)
+            rows.append({
+                "trace_id": trace_id,
+                "root": root["name"] if root else None,
+                "duration_ms": root["duration_ms"] if root else None,
+                "spans": len(spans),
+                "errors": sum(1 for item in spans if item["status"] == "error"),
+            })
+        rows.sort(key=lambda row: -(row["duration_ms"] or 0))
+        return rows[:limit]
+
+    def trace(self, trace_id: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            spans = self.traces.get(trace_id)
+            return list(spans) if spans is not None else None
+
+class CollectorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: CollectorState
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Any) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        if path == "/traces":
+            self._send_json(200, self.state.summary())
+        elif path.startswith("/traces/"):
+            spans = self.state.trace(path[len("/traces/"):])
+            self._send_json(200 if spans is not None else 404, spans or {"error": "unknown trace"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if self.path.rstrip("/") != "/v1/traces":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+        self.state.add(flatten(payload))
+        self._send_json(200, {"partialSuccess": {}})
+
+def serve(output: Optional[str] = None, host: str = "127.0.0.1", port: int = 4318, background: bool = False) -> ThreadingHTTPServer:
+    """Start the collector; port 0 picks a free port (see server.server_address)."""
+    handler = type("BoundCollectorHandler", (CollectorHandler,), {"state": CollectorState(output)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    if background:
+        threading.Thread(target=server.serve_forever, name="trace-collector", daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--output", help="append received spans to this JSONL file")
+    args = parser.parse_args()
+    print(f"Trace collector on http://{args.host}:{args.port}/v1/traces")
+    serve(args.output, args.host, args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""Lightweight span tracing for generation requests.
+
+Each generate_* call opens a root span; upstream calls, parsing, validation
+and regeneration open child spans under whatever span is current, so one
+trace shows where a slow click spent its time:
+
+    with span("validate", industry=industry, items=len(texts)) as current:
+        verdicts = ...
+        current.set(passed=sum(verdicts))
+
+The current span lives in a contextvar, so concurrent asyncio tasks started
+under a span (asyncio.gather, hedged calls) attach their spans to it. Spans
+of a trace are buffered until the root span ends; the finished trace is then
+tail-sampled and handed to a background exporter thread, so exporting never
+blocks a request.
+
+Exporters:
+    jsonl   one JSON line per span, appended to TRACE_FILE
+    otlp    OTLP/HTTP JSON posted to TRACE_OTLP_ENDPOINT (see trace_collector.py
+            for a local stand-in collector)
+
+Configuration (environment variables):
+    TRACE_EXPORT         comma-separated exporters: "jsonl", "otlp" (default: tracing off)
+    TRACE_FILE           JSONL output file (default traces.jsonl)
+    TRACE_OTLP_ENDPOINT  collector URL (default http://127.0.0.1:4318/v1/traces)
+    TRACE_SLOW_SECONDS   tail sampling: keep only traces at least this slow,
+                         plus traces with errors (default 0, keep all)
+"""
+import asyncio
+import atexit
+import contextlib
+import contextvars
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+import urllib.request
+from typing import Any, Dict, Iterator, List, Optional
+
+from env import env_float
+from logs import get_logger
+
+log = get_logger("tracing")
+
+class _Trace:
+    """Spans of one trace, collected until the root span ends."""
+
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self.spans: List["Span"] = []
+        self.finished = False
+
+class Span:
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attributes):
+        self.name = name
+        self.parent = parent
+        self.trace = parent.trace if parent is not None else _Trace()
+        self.span_id = secrets.token_hex(8)
+        self.attributes: Dict[str, Any] = dict(attributes)
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    @property
+    def is_root(self) -> bool:
+        return self.parent is None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        self.attributes[name] = self.attributes.get(name, 0) + amount
+
+    def fail(self, error: BaseException) -> None:
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self) -> None:
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        if self.trace.finished:
+            # Ended after its root (e.g. a hedged call that lost and was discarded late)
+            return
+        self.trace.spans.append(self)
+        if self.is_root:
+            self.trace.finished = True
+            _finish_trace(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "name": self.name,
+            "start": self.start_time,
+            "duration_ms": round((self.duration or 0) * 1000, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+class _NoopSpan:
+    """Stand-in returned when tracing is off, so call sites need no checks."""
+    trace_id = None
+    span_id = None
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        pass
+
+    def fail(self, error: BaseException) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+def tracing_enabled() -> bool:
+    return bool(_exporters())
+
+def current_span():
+    """The span of the running task, or a no-op span outside any trace."""
+    return _current_span.get() or NOOP_SPAN
+
+def start_span(name: str, **attributes):
+    """Start a child of the current span without making it current; call .end() when done.
+
+    Used for spans that outlive a single await, such as upstream streams, where
+    making the span current would leak it into the consumer between yields.
+    """
+    if not tracing_enabled():
+        return NOOP_SPAN
+    return Span(name, _current_span.get(), **attributes)
+
+@contextlib.contextmanager
+def span(name: str, **attributes) -> Iterator:
+    """Run a block as a span: a root span if none is current, otherwise a child."""
+    if not tracing_enabled():
+        yield NOOP_SPAN
+        return
+    current = Span(name, _current_span.get(), **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except (GeneratorExit, asyncio.CancelledError):
+        # Abandoned streams and cancelled hedges are not failures
+        current.status = "cancelled"
+        raise
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Closed from another context (an async generator finalised elsewhere)
+            pass
+        current.end()
+
+# -- Sampling and export --
+
+def _keep(root: Span) -> bool:
+    """Tail sampling: keep slow traces and traces with errors."""
+    threshold = env_float("TRACE_SLOW_SECONDS", 0)
+    if threshold <= 0 or (root.duration or 0) >= threshold:
+        return True
+    return any(item.status == "error" for item in root.trace.spans)
+
+class JsonlExporter:
+    """Appends one JSON line per span to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Span]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            for item in spans:
+                f.write(json.dumps(item.to_dict(), default=str) + "\n")
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+class OtlpExporter:
+    """Posts traces to an OTLP/HTTP collector using the JSON encoding."""
+
+    def __init__(self, endpoint: str, service_name: str = "manual-vertical-service"):
+        self.endpoint = endpoint
+        self.service_name = service_name
+
+    def _span(self, item: Span) -> Dict[str, Any]:
+        start = int(item.start_time * 1e9)
+        encoded = {
+            "traceId": item.trace_id,
+            "spanId": item.span_id,
+            "name": item.name,
+            "kind": 1,
+            "startTimeUnixNano": str(start),
+            "endTimeUnixNano": str(start + int((item.duration or 0) * 1e9)),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in item.attributes.items()],
+            "status": {"code": 2, "message": item.error} if item.status == "error" else {"code": 1 if item.status == "ok" else 0},
+        }
+        if item.parent is not None:
+            encoded["parentSpanId"] = item.parent.span_id
+        return encoded
+
+    def payload(self, spans: List[Span]) -> Dict[str, Any]:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "mvs.tracing"}, "spans": [self._span(item) for item in spans]}],
+        }]}
+
+    def export(self, spans: List[Span]) -> None:
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(self.payload(spans), default=str).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=5) as response:
+            response.read()
+
+_exporter_cache: Dict[str, list] = {}
+
+def _exporters() -> list:
+    """Exporters named by TRACE_EXPORT, built once per configuration."""
+    names = os.getenv("TRACE_EXPORT", "")
+    exporters = _exporter_cache.get(names)
+    if exporters is None:
+        exporters = []
+        for name in (part.strip().lower() for part in names.split(",")):
+            if name == "jsonl":
+                exporters.append(JsonlExporter(os.getenv("TRACE_FILE", "traces.jsonl")))
+            elif name == "otlp":
+                exporters.append(OtlpExporter(os.getenv("TRACE_OTLP_ENDPOINT", "http://127.0.0.1:4318/v1/traces")))
+            elif name:
+                log.warning("unknown trace exporter, ignoring", exporter=name)
+        _exporter_cache[names] = exporters
+    return exporters
+
+_export_queue: "queue.SimpleQueue[Optional[List[Span]]]" = queue.SimpleQueue()
+_export_thread: Optional[threading.Thread] = None
+_export_lock = threading.Lock()
+
+def _export_worker() -> None:
+    while True:
+        spans = _export_queue.get()
+        if spans is None:
+            return
+        for exporter in _exporters():
+            try:
+                exporter.export(spans)
+            except Exception as e:
+                log.warning("trace export failed", exporter=type(exporter).__name__, error=str(e))
+
+def _stop_exporter() -> None:
+    """Flush queued traces at interpreter exit."""
+    if _export_thread is not None:
+        _export_queue.put(None)
+        _export_thread.join(timeout=5)
+
+def _finish_trace(root: Span) -> None:
+    global _export_thread
+    if not _keep(root):
+        return
+    with _export_lock:
+        if _export_thread is None:
+            _export_thread = threading.Thread(target=_export_worker, name="trace-exporter", daemon=True)
+            _export_thread.start()
+            atexit.register(_stop_exporter)
+    # Parents end after their children; export the root first for readability
+    _export_queue.put(list(reversed(root.trace.spans)))
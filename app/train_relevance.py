@@ -0,0 +1,110 @@
+"""Train and evaluate the local industry-relevance model against logged LLM verdicts.
+
+Collect verdicts by running the app with RELEVANCE_VERDICT_LOG=verdicts.jsonl,
+then:
+
+    python train_relevance.py --log verdicts.jsonl --report relevance_report.json
+
+The report compares the vocabulary-seeded model and the trained model with the
+LLM verdicts on a held-out split: accuracy, precision and recall, how many items
+the hybrid backend would still send to the LLM, the accuracy of the hybrid
+backend, and the mean local scoring time.
+"""
+import argparse
+import json
+import time
+import zlib
+from typing import Dict, List, Tuple
+
+from relevance import DEFAULT_MODEL_PATH, HashedLinearModel, hybrid_band
+
+Example = Tuple[str, str, bool]
+
+def load_examples(path: str) -> List[Example]:
+    examples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            examples.append((record["text"], record["industry"], bool(record["is_relevant"])))
+    return examples
+
+def split_examples(examples: List[Example], eval_fraction: float) -> Tuple[List[Example], List[Example]]:
+    """Deterministic split by text hash, so the same text never lands on both sides."""
+    train, held_out = [], []
+    for example in examples:
+        bucket = zlib.crc32(example[0].encode("utf-8")) % 1000
+        (held_out if bucket < eval_fraction * 1000 else train).append(example)
+    return train, held_out
+
+def evaluate(model: HashedLinearModel, examples: List[Example], band: Tuple[float, float]) -> Dict[str, float]:
+    true_pos = false_pos = false_neg = correct = uncertain = hybrid_correct = 0
+    start = time.perf_counter()
+    scores = [model.score(text, industry) for text, industry, _ in examples]
+    elapsed = time.perf_counter() - start
+    low, high = hybrid_band(model, band)
+    for score, (_, _, label) in zip(scores, examples):
+        predicted = score >= 0.5
+        correct += predicted == label
+        true_pos += predicted and label
+        false_pos += predicted and not label
+        false_neg += (not predicted) and label
+        if low < score < high:
+            uncertain += 1
+            hybrid_correct += 1  # the LLM decides these, so they agree by definition
+        else:
+            hybrid_correct += predicted == label
+    total = len(examples) or 1
+    return {
+        "examples": len(examples),
+        "accuracy_vs_llm": correct / total,
+        "precision": true_pos / ((true_pos + false_pos) or 1),
+        "recall": true_pos / ((true_pos + false_neg) or 1),
+        "hybrid_llm_call_rate": uncertain / total,
+        "hybrid_accuracy_vs_llm": hybrid_correct / total,
+        "mean_score_microseconds": elapsed / total * 1e6,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", required=True, help="JSONL file of logged LLM verdicts")
+    parser.add_argument("--output", default=DEFAULT_MODEL_PATH, help="where to write the trained model")
+    parser.add_argument("--report", help="optional path for the JSON evaluation report")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--learning-rate", type=float, default=0.2)
+    parser.add_argument("--eval-fraction", type=float, default=0.2)
+    parser.add_argument("--band", default="0.2,0.8", help="uncertain score band sent to the LLM, as low,high")
+    args = parser.parse_args()
+
+    band = tuple(float(x) for x in args.band.split(","))
+    examples = load_examples(args.log)
+    train, held_out = split_examples(examples, args.eval_fraction)
+    print(f"Loaded {len(examples)} verdicts: {len(train)} train, {len(held_out)} eval")
+
+    seed = HashedLinearModel.from_vocabulary()
+    trained = HashedLinearModel.from_vocabulary()
+    trained.train(train, epochs=args.epochs, learning_rate=args.learning_rate)
+    trained.save(args.output)
+    print(f"Saved trained model to {args.output}")
+
+    report = {
+        "band": band,
+        "seed": evaluate(seed, held_out, band),
+        "trained": evaluate(trained, held_out, band),
+    }
+    for name in ("seed", "trained"):
+        metrics = report[name]
+        print(
+            f"{name:>8}: accuracy {metrics['accuracy_vs_llm']:.3f}  precision {metrics['precision']:.3f}  "
+            f"recall {metrics['recall']:.3f}  hybrid LLM calls {metrics['hybrid_llm_call_rate']:.1%}  "
+            f"hybrid accuracy {metrics['hybrid_accuracy_vs_llm']:.3f}  {metrics['mean_score_microseconds']:.1f} us/item"
+        )
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote report to {args.report}")
+
+if __name__ == "__main__":
+    main()